@@ -1,47 +1,533 @@
 import operator
+from array import array
+from collections import Counter
+from memory import MEMORY_BACKENDS
+from channels import StreamSink, ConsoleSource
+
+# Opcodes of the pre-decoded bytecode executed by LVM.run
+STP, LDC, LDV, LDR, STV, SRV, LRV, ALC, DLC = range(9)
+ADD, SUB, MUL, DIV, AND, OR, LES, LEQ, GRT, GTE, EQU, NEQ, MOD = range(9, 22)
+NEG, ABS, NOT = range(22, 25)
+CFU, ENF, RET, IDX, GRC, LMV, SMV, SMR, STS = range(25, 34)
+RDV, RDS, PRV, PRT, PRC, PRS, LBL, NOP, END, JOF, JMP = range(34, 45)
+INC, LXV, LCB, LLB, CJF, JNL = range(45, 51)
+
+# Opcodes that push a boolean
+BOOLEAN_RESULTS = frozenset((LES, LEQ, GRT, GTE, EQU, NEQ, AND, OR, NOT))
+
+
+class Bytecode:
+    """
+    Flat, linked form of an operator list: one opcode array and parallel
+    operand arrays, plus the constant pool referenced by ldc. Label
+    definitions are not part of the stream; jump operands hold the pc of
+    the slot the label occupied, so execution resumes right after it.
+    """
+    def __init__(self):
+        self.code = array('i')
+        self.arg1 = array('q')
+        self.arg2 = array('q')
+        self.arg3 = array('q')
+        self.arg4 = array('q')
+        self.consts = []
+        self.label_to_pc = {}
+        # Original label operand of every jump, kept for disassembly
+        self.jump_labels = {}
+
+    def __len__(self):
+        return len(self.code)
+
+    def disassemble(self):
+        pc_to_labels = {}
+        for label, pc in self.label_to_pc.items():
+            pc_to_labels.setdefault(pc + 1, []).append(label)
+
+        lines = []
+        for pc in range(len(self.code) + 1):
+            for label in sorted(pc_to_labels.get(pc, [])):
+                lines.append("      L{}:".format(label))
+            if pc == len(self.code):
+                break
+            cls = OPERATOR_FOR_OPCODE[self.code[pc]]
+            args = [self.arg1[pc], self.arg2[pc], self.arg3[pc], self.arg4[pc]]
+            for i, kind in enumerate(cls.operand_kinds):
+                if kind == 'const':
+                    args[i] = repr(self.consts[args[i]])
+                elif kind == 'label':
+                    args[i] = "L{}".format(self.jump_labels[pc])
+                elif kind == 'opcode':
+                    args[i] = OPERATOR_FOR_OPCODE[args[i]].op_name
+            args = [str(arg) for arg in args[:len(cls.operand_kinds)]]
+            lines.append("{:>5} {}".format(pc, " ".join([cls.op_name] + args)))
+        return "\n".join(lines)
+
+
+def link(operator_list):
+    """
+    Drops label definitions from the operator list and maps every label
+    to the pc its lbl instruction would have had in the linked stream.
+    """
+    linked = []
+    label_to_pc = {}
+    for op in operator_list:
+        if op.opcode == LBL:
+            label_to_pc[op.op1] = len(linked) - 1
+        else:
+            linked.append(op)
+    return linked, label_to_pc
+
+
+def decode(operator_list):
+    bytecode = Bytecode()
+    linked, bytecode.label_to_pc = link(operator_list)
+    const_index = {}
+    for pc, op in enumerate(linked):
+        args = list(op.operands)
+        for i, kind in enumerate(op.operand_kinds):
+            if kind == 'const':
+                # bools and ints compare equal, so the key keeps the type
+                key = (type(args[i]), args[i])
+                if key not in const_index:
+                    const_index[key] = len(bytecode.consts)
+                    bytecode.consts.append(args[i])
+                args[i] = const_index[key]
+            elif kind == 'label':
+                bytecode.jump_labels[pc] = args[i]
+                args[i] = bytecode.label_to_pc[args[i]]
+        bytecode.code.append(op.opcode)
+        bytecode.arg1.append(int(args[0] or 0))
+        bytecode.arg2.append(int(args[1] or 0))
+        bytecode.arg3.append(int(args[2] or 0))
+        bytecode.arg4.append(int(args[3] or 0))
+    return bytecode
+
+
+def stores_booleans(bytecode):
+    """
+    Whether the program may keep a boolean in memory, other than for the
+    jof right after the instruction that pushed it.
+    """
+    code, consts = bytecode.code, bytecode.consts
+    for pc, op in enumerate(code):
+        if op == LDC:
+            boolean = type(consts[bytecode.arg1[pc]]) is bool
+        elif op == LCB or op == LLB:
+            boolean = bytecode.arg4[pc] in BOOLEAN_RESULTS
+        else:
+            boolean = op in BOOLEAN_RESULTS
+        if boolean and (pc + 1 == len(code) or code[pc + 1] != JOF):
+            return True
+    return False
 
 
 class LVM:
-    def __init__(self, operator_list):
+    def __init__(self, operator_list, memory='list', stack_size=10000, output=None, input=None):
         self.pc = 0
         self.sp = -1
-        self.M = [None] * 10000
+        if isinstance(memory, str):
+            memory = MEMORY_BACKENDS[memory](stack_size)
+        self.memory = memory
+        self.output = StreamSink() if output is None else output
+        self.input = ConsoleSource() if input is None else input
         self.bp = 0
         self.D = [None] * 10
         self.P = operator_list
         self.H = []
         self.label_to_pc = {}
+        self.bytecode = None
+        self.compiled = None
+
+    @property
+    def M(self):
+        return self.memory.data
 
     def top_of_stack(self):
         return self.M[self.sp]
 
     def stack(self):
-        return self.M[:self.sp + 1]
+        return self.memory.values(0, self.sp + 1)
+
+    def decode(self):
+        if self.bytecode is None:
+            self.bytecode = decode(self.P)
+            self.label_to_pc = self.bytecode.label_to_pc
+        return self.bytecode
+
+    def fit_memory(self, bytecode):
+        """
+        Int64 cells would keep booleans as 1 and 0, so typed memory is
+        widened before running a program that stores them.
+        """
+        if self.memory.typed and stores_booleans(bytecode):
+            self.memory.widen()
 
     def run(self):
+        bytecode = self.decode()
+        self.fit_memory(bytecode)
+        try:
+            self.execute(bytecode)
+        finally:
+            self.output.flush()
+
+    def run_compiled(self):
+        """
+        Runs the program as Python code generated by jit.compile_bytecode.
+        Typed memory may have to widen in the middle of an instruction, which
+        only the interpreter can retry, so it always runs interpreted.
+        """
+        bytecode = self.decode()
+        if self.memory.typed:
+            return self.run()
+        if self.compiled is None:
+            from jit import compile_bytecode
+            self.compiled = compile_bytecode(bytecode)
+        try:
+            pc, self.sp = self.compiled(self.memory, self.D, self.H, bytecode.consts,
+                                       self.output, self.input, self.sp, 0)
+            self.pc = pc
+            if pc < len(bytecode):
+                self.execute(bytecode, pc)
+        finally:
+            self.output.flush()
+
+    def profile(self, bigrams=None):
+        """
+        Runs the program one operator at a time through the execute()
+        methods, counting how often each pair of opcodes runs back to back.
+        Passing the Counter of a previous run accumulates over a workload.
+        The pairs are those of the operator list as given: code that went
+        through the peephole optimizer has its sequences already fused, so
+        fusion candidates are found by profiling unoptimized code.
+        """
+        if bigrams is None:
+            bigrams = Counter()
+        self.fit_memory(self.decode())
+        linked, self.label_to_pc = link(self.P)
+        memory = self.memory
+        prev = None
         self.pc = 0
-        while self.pc < len(self.P):
-            self.P[self.pc].first_pass(lvm=self)
-            self.pc += 1
-
-        self.pc = 0
-        while self.pc < len(self.P):
-            next_instr = self.P[self.pc]
-            #print(self.pc, next_instr)
-            next_instr.execute(lvm=self)
-            self.pc += 1
-            #print(self.stack())
+        try:
+            while self.pc < len(linked):
+                cur = linked[self.pc].op_name
+                if prev is not None:
+                    bigrams[prev, cur] += 1
+                # The execute() methods may move sp, pc and D before the
+                # write that faults, so they are put back before a retry
+                sp, pc, D = self.sp, self.pc, list(self.D)
+                while True:
+                    try:
+                        linked[self.pc].execute(lvm=self)
+                        break
+                    except IndexError:
+                        if sp + 2 <= len(memory):
+                            raise
+                        memory.ensure(sp + 2)
+                    except (TypeError, ValueError, OverflowError):
+                        if not memory.typed:
+                            raise
+                        memory.widen()
+                    self.sp, self.pc = sp, pc
+                    self.D[:] = D
+                prev = cur
+                self.pc += 1
+        finally:
+            self.output.flush()
+        return bigrams
+
+    def execute(self, bytecode, pc=0):
+        # Everything the loop touches is held in locals; each branch mirrors
+        # the execute() method of the operator class with the same opcode.
+        code, arg1, arg2, arg3, arg4 = bytecode.code, bytecode.arg1, bytecode.arg2, bytecode.arg3, bytecode.arg4
+        binary = BINARY_OPERATORS
+        consts = bytecode.consts
+        memory = self.memory
+        M, D, H = memory.data, self.D, self.H
+        write, flush = self.output.write, self.output.flush
+        read_value, read_string = self.input.read_value, self.input.read_string
+        sp = self.sp
+        n = len(code)
+
+        # Branches write memory before touching sp, pc or D, so an instruction
+        # that faults can be retried once the memory has grown or widened
+        while True:
+            try:
+                while pc < n:
+                    op = code[pc]
+                    if op == LDV:
+                        M[sp + 1] = M[D[arg1[pc]] + arg2[pc]]
+                        sp += 1
+                    elif op == LCB:
+                        M[sp + 1] = binary[arg4[pc]](M[D[arg1[pc]] + arg2[pc]], consts[arg3[pc]])
+                        sp += 1
+                    elif op == LLB:
+                        base = D[arg1[pc]]
+                        M[sp + 1] = binary[arg4[pc]](M[base + arg2[pc]], M[base + arg3[pc]])
+                        sp += 1
+                    elif op == CJF:
+                        if not binary[arg2[pc]](M[sp - 1], M[sp]):
+                            pc = arg1[pc]
+                        sp -= 2
+                    elif op == JNL:
+                        if not M[D[arg1[pc]] + arg2[pc]] < consts[arg3[pc]]:
+                            pc = arg4[pc]
+                    elif op == LDC:
+                        M[sp + 1] = consts[arg1[pc]]
+                        sp += 1
+                    elif op == STV:
+                        M[D[arg1[pc]] + arg2[pc]] = M[sp]
+                        sp -= 1
+                    elif op == ADD:
+                        M[sp - 1] = M[sp - 1] + M[sp]
+                        sp -= 1
+                    elif op == INC:
+                        M[D[arg1[pc]] + arg2[pc]] += consts[arg3[pc]]
+                    elif op == LXV:
+                        M[sp - 1] = M[M[sp - 1] + M[sp] * arg1[pc]]
+                        sp -= 1
+                    elif op == JOF:
+                        if not M[sp]:
+                            pc = arg1[pc]
+                        sp -= 1
+                    elif op == JMP:
+                        pc = arg1[pc]
+                    elif op == NOP:
+                        pass
+                    elif op == LDR:
+                        M[sp + 1] = D[arg1[pc]] + arg2[pc]
+                        sp += 1
+                    elif op == IDX:
+                        M[sp - 1] += M[sp] * arg1[pc]
+                        sp -= 1
+                    elif op == LMV:
+                        t = M[sp]
+                        k = arg1[pc]
+                        if k == 1:
+                            M[sp] = M[t]
+                        else:
+                            M = memory.ensure(max(sp, t) + k)
+                            memory.copy(sp, t, k)
+                    elif op == SMV:
+                        k = arg1[pc]
+                        t = M[sp - k]
+                        if k == 1:
+                            M[t] = M[sp]
+                        else:
+                            M = memory.ensure(t + k)
+                            memory.copy(t, sp - k + 1, k)
+                        sp -= k + 1
+                    elif op == SUB:
+                        M[sp - 1] = M[sp - 1] - M[sp]
+                        sp -= 1
+                    elif op == MUL:
+                        M[sp - 1] = M[sp - 1] * M[sp]
+                        sp -= 1
+                    elif op == DIV:
+                        M[sp - 1] = M[sp - 1] // M[sp]
+                        sp -= 1
+                    elif op == MOD:
+                        M[sp - 1] = M[sp - 1] % M[sp]
+                        sp -= 1
+                    elif op == LES:
+                        M[sp - 1] = M[sp - 1] < M[sp]
+                        sp -= 1
+                    elif op == LEQ:
+                        M[sp - 1] = M[sp - 1] <= M[sp]
+                        sp -= 1
+                    elif op == GRT:
+                        M[sp - 1] = M[sp - 1] > M[sp]
+                        sp -= 1
+                    elif op == GTE:
+                        M[sp - 1] = M[sp - 1] >= M[sp]
+                        sp -= 1
+                    elif op == EQU:
+                        M[sp - 1] = M[sp - 1] == M[sp]
+                        sp -= 1
+                    elif op == NEQ:
+                        M[sp - 1] = M[sp - 1] != M[sp]
+                        sp -= 1
+                    elif op == AND:
+                        M[sp - 1] = M[sp - 1] & M[sp]
+                        sp -= 1
+                    elif op == OR:
+                        M[sp - 1] = M[sp - 1] | M[sp]
+                        sp -= 1
+                    elif op == NEG:
+                        M[sp] = -M[sp]
+                    elif op == ABS:
+                        M[sp] = abs(M[sp])
+                    elif op == NOT:
+                        M[sp] = not M[sp]
+                    elif op == LRV:
+                        M[sp + 1] = M[M[D[arg1[pc]] + arg2[pc]]]
+                        sp += 1
+                    elif op == SRV:
+                        M[M[D[arg1[pc]] + arg2[pc]]] = M[sp]
+                        sp -= 1
+                    elif op == GRC:
+                        M[sp] = M[M[sp]]
+                    elif op == ALC:
+                        sp += arg1[pc]
+                    elif op == DLC:
+                        sp -= arg1[pc]
+                    elif op == CFU:
+                        M[sp + 1] = pc
+                        sp += 1
+                        pc = arg1[pc]
+                    elif op == ENF:
+                        k = arg1[pc]
+                        M[sp + 1] = D[k]
+                        sp += 1
+                        D[k] = sp + 1
+                    elif op == RET:
+                        k = arg1[pc]
+                        frame = D[k] - 1
+                        result = frame - arg2[pc] - 2
+                        saved, ret_pc = M[frame], M[frame - 1]
+                        M[result] = M[sp]
+                        D[k] = saved
+                        pc = ret_pc
+                        sp = result
+                    elif op == SMR:
+                        k = arg1[pc]
+                        t1 = M[sp - 1]
+                        t2 = M[sp]
+                        M = memory.ensure(max(t1, t2) + k)
+                        memory.copy(t1, t2, k)
+                        sp -= 1
+                    elif op == PRT:
+                        k = arg1[pc]
+                        write(' '.join(str(x) for x in memory.values(sp - k + 1, sp + 1)) + '\n')
+                        sp -= k
+                    elif op == PRV:
+                        if arg1[pc]:
+                            write(chr(M[sp]) + '\n')
+                        else:
+                            write(str(memory.values(sp, sp + 1)[0]) + '\n')
+                        sp -= 1
+                    elif op == PRC:
+                        write(str(H[arg1[pc]]))
+                    elif op == PRS:
+                        adr = M[sp]
+                        chars = [str(M[adr + i]) for i in range(1, M[adr] + 1)]
+                        write(''.join(chars))
+                        sp -= len(chars)
+                    elif op == RDV:
+                        flush()
+                        val = read_value()
+                        M = memory.prepare(sp + 2, [val])
+                        M[sp + 1] = val
+                        sp += 1
+                    elif op == RDS:
+                        flush()
+                        string = read_string()
+                        adr = M[sp]
+                        M = memory.prepare(adr + len(string) + 1, string)
+                        M[adr] = len(string)
+                        for c in string:
+                            adr += 1
+                            M[adr] = c
+                        sp -= 1
+                    elif op == STS:
+                        adr = M[sp]
+                        string = H[arg1[pc]]
+                        M = memory.prepare(adr + len(string) + 1, string)
+                        M[adr] = len(string)
+                        for c in string:
+                            adr += 1
+                            M[adr] = c
+                        sp -= 1
+                    elif op == STP:
+                        sp = -1
+                        D[0] = 0
+                    elif op == END:
+                        flush()
+                    pc += 1
+                break
+            except IndexError:
+                # Only a stack that ran past the end is grown; any other bad
+                # address is a genuine error
+                if sp + 2 <= len(M):
+                    raise
+                M = memory.ensure(sp + 2)
+            except (TypeError, ValueError, OverflowError):
+                if not memory.typed:
+                    raise
+                M = memory.widen()
+
+        self.sp = sp
+        self.pc = pc
+
+
+# Operand types interned instructions may hold
+INTERNED_TYPES = {int, type(None)}
+# Instances interned per class at most; once full, new operands build
+# plain instances, so a long-lived process does not keep every constant
+# and offset it ever compiled
+MAX_INTERNED = 1024
 
 
 class LVMOperator:
+    """
+    One instruction. Instructions are immutable, so a program may hold the
+    same instance any number of times and rewrite passes build new ones
+    instead of changing them. Building an instruction whose operands are
+    all ints (or none at all) returns the instance made the first time with
+    those operands, for the first MAX_INTERNED operand tuples of a class;
+    instructions with labels are not interned, as labels keep growing over
+    the life of a compiler.
+    """
+    __slots__ = ('op1', 'op2', 'op3', 'op4')
     op_name = None
+    opcode = None
+    # How decode() lowers each operand: 'int' and 'opcode' are stored as is,
+    # 'const' goes through the constant pool and 'label' is resolved to a pc
+    operand_kinds = ()
+    # Instances already built, by operands; None for classes not interned
+    interned = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.interned = None if 'label' in cls.operand_kinds else {}
+
+    def __new__(cls, op1=None, op2=None, op3=None, op4=None):
+        interned = cls.interned
+        key = None
+        # bools compare equal to ints, so only exact ints make up a key
+        if interned is not None and type(op1) in INTERNED_TYPES and type(op2) in INTERNED_TYPES \
+                and type(op3) in INTERNED_TYPES and type(op4) in INTERNED_TYPES:
+            key = op1, op2, op3, op4
+            op = interned.get(key)
+            if op is not None:
+                return op
+        op = object.__new__(cls)
+        assign = object.__setattr__
+        assign(op, 'op1', op1)
+        assign(op, 'op2', op2)
+        assign(op, 'op3', op3)
+        assign(op, 'op4', op4)
+        if key is not None and len(interned) < MAX_INTERNED:
+            interned[key] = op
+        return op
+
+    def __setattr__(self, name, value):
+        raise AttributeError("instructions are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("instructions are immutable")
+
+    def __reduce__(self):
+        return type(self), self.operands
 
-    def __init__(self, op1=None, op2=None):
-        self.op1 = op1
-        self.op2 = op2
+    @property
+    def operands(self):
+        return self.op1, self.op2, self.op3, self.op4
 
     @property
     def tuple(self):
+        if self.op4 is not None:
+            return self.op_name, self.op1, self.op2, self.op3, self.op4
+        if self.op3 is not None:
+            return self.op_name, self.op1, self.op2, self.op3
         if self.op2 is not None:
             return self.op_name, self.op1, self.op2
         if self.op1 is not None:
@@ -58,12 +544,11 @@ class LVMOperator:
     def execute(self, lvm):
         pass
 
-    def first_pass(self, lvm):
-        pass
-
 
 class StartOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'stp'
+    opcode = STP
 
     def execute(self, lvm):
         lvm.sp = -1
@@ -71,7 +556,10 @@ class StartOperator(LVMOperator):
 
 
 class LoadConstantOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'ldc'
+    opcode = LDC
+    operand_kinds = ('const',)
 
     def execute(self, lvm):
         lvm.sp += 1
@@ -79,7 +567,10 @@ class LoadConstantOperator(LVMOperator):
 
 
 class LoadValueOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'ldv'
+    opcode = LDV
+    operand_kinds = ('int', 'int')
 
     def execute(self, lvm):
         lvm.sp += 1
@@ -87,7 +578,10 @@ class LoadValueOperator(LVMOperator):
 
 
 class LoadReferenceOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'ldr'
+    opcode = LDR
+    operand_kinds = ('int', 'int')
 
     def execute(self, lvm):
         lvm.sp += 1
@@ -95,7 +589,10 @@ class LoadReferenceOperator(LVMOperator):
 
 
 class StoreValueOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'stv'
+    opcode = STV
+    operand_kinds = ('int', 'int')
 
     def execute(self, lvm):
         lvm.M[lvm.D[self.op1] + self.op2] = lvm.M[lvm.sp]
@@ -103,7 +600,10 @@ class StoreValueOperator(LVMOperator):
 
 
 class StoreReferenceValueOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'srv'
+    opcode = SRV
+    operand_kinds = ('int', 'int')
 
     def execute(self, lvm):
         lvm.M[lvm.M[lvm.D[self.op1] + self.op2]] = lvm.M[lvm.sp]
@@ -111,7 +611,10 @@ class StoreReferenceValueOperator(LVMOperator):
 
 
 class LoadReferenceValueOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'lrv'
+    opcode = LRV
+    operand_kinds = ('int', 'int')
 
     def execute(self, lvm):
         lvm.sp += 1
@@ -119,20 +622,27 @@ class LoadReferenceValueOperator(LVMOperator):
 
 
 class AllocateOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'alc'
+    opcode = ALC
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         lvm.sp += self.op1
 
 
 class DeallocateOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'dlc'
+    opcode = DLC
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         lvm.sp -= self.op1
 
 
 class BinOPOperator(LVMOperator):
+    __slots__ = ()
     operator = None
 
     def execute(self, lvm):
@@ -141,71 +651,98 @@ class BinOPOperator(LVMOperator):
 
 
 class AddOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'add'
+    opcode = ADD
     operator = operator.add
 
 
 class SubOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'sub'
+    opcode = SUB
     operator = operator.sub
 
 
 class MulOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'mul'
+    opcode = MUL
     operator = operator.mul
 
 
 class DivOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'div'
+    opcode = DIV
     operator = operator.floordiv
 
 
 class LogicalAndOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'and'
+    opcode = AND
     operator = operator.and_
 
 
 class LogicalOrOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'or'
+    opcode = OR
     operator = operator.or_
 
 
 class LessOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'les'
+    opcode = LES
     operator = operator.lt
 
 
 class LessOrEqualOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'leq'
+    opcode = LEQ
     operator = operator.le
 
 
 class GreaterOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'grt'
+    opcode = GRT
     operator = operator.gt
 
 
 class GreaterOrEqualOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'gte'
+    opcode = GTE
     operator = operator.ge
 
 
 class EqualOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'equ'
+    opcode = EQU
     operator = operator.eq
 
 
 class NotEqualOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'neq'
+    opcode = NEQ
     operator = operator.ne
 
 
 class ModOperator(BinOPOperator):
+    __slots__ = ()
     op_name = 'mod'
+    opcode = MOD
     operator = operator.mod
 
 
 class UnOPOperator(LVMOperator):
+    __slots__ = ()
     operator = None
 
     def execute(self, lvm):
@@ -213,22 +750,31 @@ class UnOPOperator(LVMOperator):
 
 
 class NegateOperator(UnOPOperator):
+    __slots__ = ()
     op_name = 'neg'
+    opcode = NEG
     operator = operator.neg
 
 
 class AbsoluteOperator(UnOPOperator):
+    __slots__ = ()
     op_name = 'abs'
+    opcode = ABS
     operator = operator.abs
 
 
 class NotOperator(UnOPOperator):
+    __slots__ = ()
     op_name = 'not'
+    opcode = NOT
     operator = operator.not_
 
 
 class CallFunctionOperator(LVMOperator):
+    __slots__ = ()
     op_name = "cfu"
+    opcode = CFU
+    operand_kinds = ('label',)
 
     def execute(self, lvm):
         lvm.sp += 1
@@ -237,7 +783,10 @@ class CallFunctionOperator(LVMOperator):
 
 
 class EnterFunctionOperator(LVMOperator):
+    __slots__ = ()
     op_name = "enf"
+    opcode = ENF
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         lvm.sp += 1
@@ -246,7 +795,10 @@ class EnterFunctionOperator(LVMOperator):
 
 
 class ReturnFromFunctionOperator(LVMOperator):
+    __slots__ = ()
     op_name = "ret"
+    opcode = RET
+    operand_kinds = ('int', 'int')
 
     def execute(self, lvm):
         # TODO: TALVEZ lvm.M[lvm.D[self.op1]] = ...
@@ -259,7 +811,10 @@ class ReturnFromFunctionOperator(LVMOperator):
 
 
 class IndexOperator(LVMOperator):
+    __slots__ = ()
     op_name = "idx"
+    opcode = IDX
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         lvm.M[lvm.sp - 1] += lvm.M[lvm.sp] * self.op1
@@ -267,14 +822,19 @@ class IndexOperator(LVMOperator):
 
 
 class GetReferenceContentsOperator(LVMOperator):
+    __slots__ = ()
     op_name = "grc"
+    opcode = GRC
 
     def execute(self, lvm):
         lvm.M[lvm.sp] = lvm.M[lvm.M[lvm.sp]]
 
 
 class LoadMultipleValuesOperator(LVMOperator):
+    __slots__ = ()
     op_name = "lmv"
+    opcode = LMV
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         t = lvm.M[lvm.sp]
@@ -283,7 +843,10 @@ class LoadMultipleValuesOperator(LVMOperator):
 
 
 class StoreMultipleValuesOperator(LVMOperator):
+    __slots__ = ()
     op_name = "smv"
+    opcode = SMV
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         k = self.op1
@@ -293,7 +856,10 @@ class StoreMultipleValuesOperator(LVMOperator):
 
 
 class StoreMultipleReferencesOperator(LVMOperator):
+    __slots__ = ()
     op_name = "smr"
+    opcode = SMR
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         t1 = lvm.M[lvm.sp - 1]
@@ -303,38 +869,46 @@ class StoreMultipleReferencesOperator(LVMOperator):
 
 
 class StoreStringConstantOperator(LVMOperator):
+    __slots__ = ()
     op_name = "sts"
+    opcode = STS
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         adr = lvm.M[lvm.sp]
-        lvm.M[adr] = len(lvm.H[self.op1])
-        for c in lvm.H[self.op1]:
+        string = lvm.H[self.op1]
+        lvm.memory.prepare(adr + len(string) + 1, string)
+        lvm.M[adr] = len(string)
+        for c in string:
             adr += 1
             lvm.M[adr] = c
         lvm.sp -= 1
 
 
 class ReadValueOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'rdv'
+    opcode = RDV
 
     def execute(self, lvm):
+        lvm.output.flush()
+        val = lvm.input.read_value()
+        # Made to fit first, so the input is not read again on a retry
+        lvm.memory.prepare(lvm.sp + 2, [val])
         lvm.sp += 1
-        val = input()
-        if val == "TRUE" or val == "FALSE":
-            val = int(val == "TRUE")
-        try:
-            val = int(val)
-        except ValueError:
-            pass
         lvm.M[lvm.sp] = val
 
 
 class ReadStringOperator(LVMOperator):
+    __slots__ = ()
     op_name = "rds"
+    opcode = RDS
 
     def execute(self, lvm):
-        string = input()
+        lvm.output.flush()
+        string = lvm.input.read_string()
         adr = lvm.M[lvm.sp]
+        lvm.memory.prepare(adr + len(string) + 1, string)
         lvm.M[adr] = len(string)
         for k in string:
             adr += 1
@@ -343,60 +917,81 @@ class ReadStringOperator(LVMOperator):
 
 
 class PrintValueOperator(LVMOperator):
+    __slots__ = ()
     op_name = "prv"
+    opcode = PRV
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
         if self.op1:
-            print(chr(lvm.M[lvm.sp]))
+            lvm.output.write(chr(lvm.M[lvm.sp]) + '\n')
         else:
-            print(lvm.M[lvm.sp])
+            lvm.output.write(str(lvm.memory.values(lvm.sp, lvm.sp + 1)[0]) + '\n')
         lvm.sp -= 1
 
 
 class PrintMultipleValuesOperator(LVMOperator):
+    __slots__ = ()
     op_name = "prt"
+    opcode = PRT
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
-        print(' '.join(str(x) for x in lvm.M[lvm.sp - self.op1 + 1:lvm.sp + 1]))
+        lvm.output.write(' '.join(str(x) for x in lvm.memory.values(lvm.sp - self.op1 + 1, lvm.sp + 1)) + '\n')
         lvm.sp -= self.op1
 
 
 class PrintStringConstantOperator(LVMOperator):
+    __slots__ = ()
     op_name = "prc"
+    opcode = PRC
+    operand_kinds = ('int',)
 
     def execute(self, lvm):
-        print(lvm.H[self.op1], end="")
+        lvm.output.write(str(lvm.H[self.op1]))
 
 
 class PrintStringLocation(LVMOperator):
+    __slots__ = ()
     op_name = "prs"
+    opcode = PRS
 
     def execute(self, lvm):
         adr = lvm.M[lvm.sp]
         length = lvm.M[adr]
         for i in range(length):
             adr += 1
-            print(lvm.M[adr], end="")
+            lvm.output.write(str(lvm.M[adr]))
             lvm.sp -= 1
 
 
 class DefineLabelOperator(LVMOperator):
+    __slots__ = ()
     op_name = "lbl"
-
-    def first_pass(self, lvm):
-        lvm.label_to_pc[self.op1] = lvm.pc
+    opcode = LBL
+    operand_kinds = ('int',)
 
 
 class NoOperationOperator(LVMOperator):
+    __slots__ = ()
     op_name = "nop"
+    opcode = NOP
 
 
 class StopProgramOperator(LVMOperator):
+    __slots__ = ()
     op_name = "end"
+    opcode = END
+
+    def execute(self, lvm):
+        lvm.output.flush()
 
 
 class JumpOnFalseOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'jof'
+    opcode = JOF
+    operand_kinds = ('label',)
 
     def execute(self, lvm):
         if not lvm.M[lvm.sp]:
@@ -405,7 +1000,95 @@ class JumpOnFalseOperator(LVMOperator):
 
 
 class JumpOperator(LVMOperator):
+    __slots__ = ()
     op_name = 'jmp'
+    opcode = JMP
+    operand_kinds = ('label',)
+
+    def execute(self, lvm):
+        lvm.pc = lvm.label_to_pc[self.op1]
+
+
+class IncrementValueOperator(LVMOperator):
+    __slots__ = ()
+    op_name = 'inc'
+    opcode = INC
+    operand_kinds = ('int', 'int', 'const')
+
+    def execute(self, lvm):
+        lvm.M[lvm.D[self.op1] + self.op2] += self.op3
+
+
+class LoadIndexedValueOperator(LVMOperator):
+    __slots__ = ()
+    op_name = 'lxv'
+    opcode = LXV
+    operand_kinds = ('int',)
+
+    def execute(self, lvm):
+        lvm.M[lvm.sp - 1] = lvm.M[lvm.M[lvm.sp - 1] + lvm.M[lvm.sp] * self.op1]
+        lvm.sp -= 1
+
+
+class LoadConstantBinOPOperator(LVMOperator):
+    __slots__ = ()
+    # ldv l o; ldc k; <binop>
+    op_name = 'lcb'
+    opcode = LCB
+    operand_kinds = ('int', 'int', 'const', 'opcode')
+
+    def execute(self, lvm):
+        lvm.sp += 1
+        lvm.M[lvm.sp] = BINARY_OPERATORS[self.op4](lvm.M[lvm.D[self.op1] + self.op2], self.op3)
+
+
+class LoadLoadBinOPOperator(LVMOperator):
+    __slots__ = ()
+    # ldv l o1; ldv l o2; <binop>, both values on the same display level
+    op_name = 'llb'
+    opcode = LLB
+    operand_kinds = ('int', 'int', 'int', 'opcode')
+
+    def execute(self, lvm):
+        base = lvm.D[self.op1]
+        lvm.sp += 1
+        lvm.M[lvm.sp] = BINARY_OPERATORS[self.op4](lvm.M[base + self.op2], lvm.M[base + self.op3])
+
+
+class CompareJumpOnFalseOperator(LVMOperator):
+    __slots__ = ()
+    # <binop>; jof L
+    op_name = 'cjf'
+    opcode = CJF
+    operand_kinds = ('label', 'opcode')
 
     def execute(self, lvm):
-        lvm.pc = lvm.label_to_pc[self.op1]
\ No newline at end of file
+        if not BINARY_OPERATORS[self.op2](lvm.M[lvm.sp - 1], lvm.M[lvm.sp]):
+            lvm.pc = lvm.label_to_pc[self.op1]
+        lvm.sp -= 2
+
+
+class JumpNotLessOperator(LVMOperator):
+    __slots__ = ()
+    # ldv l o; ldc k; les; jof L, the guard of counting loops
+    op_name = 'jnl'
+    opcode = JNL
+    operand_kinds = ('int', 'int', 'const', 'label')
+
+    def execute(self, lvm):
+        if not lvm.M[lvm.D[self.op1] + self.op2] < self.op3:
+            lvm.pc = lvm.label_to_pc[self.op4]
+
+
+def operator_classes(base=LVMOperator):
+    for cls in base.__subclasses__():
+        if cls.opcode is not None:
+            yield cls
+        yield from operator_classes(cls)
+
+
+OPERATOR_FOR_OPCODE = {cls.opcode: cls for cls in operator_classes()}
+
+BINARY_OPERATORS = [None] * len(OPERATOR_FOR_OPCODE)
+for cls in operator_classes(BinOPOperator):
+    BINARY_OPERATORS[cls.opcode] = cls.operator
@@ -0,0 +1,103 @@
+"""
+Checks that every example prints the same and leaves the same stack on
+each LVM memory backend, then times smr, smv and lmv block copies of 10^5
+to 10^6 cells on each of them.
+
+    $ python3 benchmarks/bench_block_copy.py
+"""
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+from common import ROOT, TABLE_DIR
+
+import LVM
+from channels import StringSink
+from compiler import Compiler
+from memory import MEMORY_BACKENDS
+
+REPEAT = 20
+# Every read of the examples gets a small count or value
+INPUT = "5\n" * 100
+
+
+def copy_program(op, size):
+    # Two arrays of `size` cells at offsets 0 and `size`, copied REPEAT times
+    ops = [LVM.StartOperator(), LVM.AllocateOperator(2 * size)]
+    for _ in range(REPEAT):
+        if op == 'smr':
+            ops += [LVM.LoadReferenceOperator(0, 0),
+                    LVM.LoadReferenceOperator(0, size),
+                    LVM.StoreMultipleReferencesOperator(size)]
+        elif op == 'lmv':
+            # lmv leaves sp on the first copied cell
+            ops += [LVM.LoadReferenceOperator(0, size),
+                    LVM.LoadMultipleValuesOperator(size),
+                    LVM.DeallocateOperator(1)]
+        else:
+            # alc only moves sp, so smv stores whatever the stack holds
+            ops += [LVM.LoadReferenceOperator(0, 0),
+                    LVM.AllocateOperator(size),
+                    LVM.StoreMultipleValuesOperator(size)]
+    return ops + [LVM.StopProgramOperator()]
+
+
+def outcome(compiler, program, memory):
+    """What running `program` on `memory` prints, the error it stops with and its stack."""
+    output = StringSink()
+    lvm = None
+    try:
+        lvm = compiler.run(program, stdin=INPUT, memory=memory, output=output)
+        error = None
+    except Exception as e:
+        error = repr(e)
+    stack = lvm.stack() if lvm is not None else None
+    return output.getvalue(), error, stack, lvm is not None and lvm.memory.typed
+
+
+def differential(names):
+    compiler = Compiler(table_dir=TABLE_DIR)
+    checked = typed = failures = 0
+    for file_name in sorted(glob.glob(os.path.join(ROOT, 'examples', '*.lya'))):
+        with open(file_name) as file, contextlib.redirect_stdout(io.StringIO()):
+            try:
+                program = compiler.compile(file.read())
+            except Exception:
+                # A few examples crash the front end, they have no code to run
+                program = None
+        if program is None:
+            continue
+        checked += 1
+        expected = outcome(compiler, program, 'list')
+        for name in names:
+            got = outcome(compiler, program, name)
+            if got[:3] != expected[:3]:
+                failures += 1
+                print("MISMATCH in {} with {} memory".format(os.path.basename(file_name), name))
+            typed += got[3]
+    print("{} examples compared, {} mismatches, {} runs kept int64 cells".format(checked, failures, typed))
+    return failures == 0
+
+
+def main():
+    names = sorted(MEMORY_BACKENDS)
+    if not differential([name for name in names if name != 'list']):
+        sys.exit(1)
+    print("{:>4} {:>8} ".format("op", "cells") + " ".join("{:>10}".format(n) for n in names))
+    for op in ('smr', 'lmv', 'smv'):
+        for size in (10 ** 5, 10 ** 6):
+            ops = copy_program(op, size)
+            timings = []
+            for name in names:
+                lvm = LVM.LVM(ops, memory=name, stack_size=4 * size)
+                start = time.perf_counter()
+                lvm.run()
+                timings.append((time.perf_counter() - start) / REPEAT)
+            print("{:>4} {:>8} ".format(op, size) + " ".join("{:>8.3f}ms".format(t * 1000) for t in timings))
+
+
+if __name__ == '__main__':
+    main()
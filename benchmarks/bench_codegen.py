@@ -0,0 +1,64 @@
+"""
+Times code generation alone over synthetic programs whose statements
+hold ever deeper expressions, and reports instructions generated per
+second. The programs are parsed and validated once, before timing. It
+also reports how many distinct instruction objects the code holds and the
+memory code generation leaves allocated, counted with tracemalloc.
+
+    $ python3 benchmarks/bench_codegen.py
+"""
+import contextlib
+import gc
+import io
+import time
+import tracemalloc
+
+from common import TABLE_DIR, synthetic_program
+
+from compiler import Compiler
+
+
+def nested_expression(depth):
+    """An expression `depth` operators deep: ((((i + 1) * s) - 2) ..."""
+    expression = "i"
+    operators = "+*-"
+    for level in range(depth):
+        operand = "s" if level % 2 else str(level + 1)
+        expression = "({} {} {})".format(expression, operators[level % len(operators)], operand)
+    return expression
+
+
+def allocated(AST):
+    """The code of AST and the bytes generating it left allocated."""
+    gc.collect()
+    tracemalloc.start()
+    code = AST.lvm_visitor()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return code, size
+
+
+def main():
+    compiler = Compiler(optimize=False, table_dir=TABLE_DIR)
+    print("{:>6} {:>13} {:>9} {:>16} {:>9} {:>7}".format(
+        "depth", "instructions", "ms", "instructions/s", "distinct", "KB"))
+    for depth in (1, 10, 50, 200):
+        AST = compiler.parse(synthetic_program(2000 // depth + 100, nested_expression(depth)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            compiler.validate(AST)
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            code = AST.lvm_visitor()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        del code
+        code, size = allocated(AST)
+        distinct = len({id(op) for op in code})
+        print("{:>6} {:>13} {:>9.1f} {:>16.0f} {:>9} {:>7.0f}".format(
+            depth, len(code), 1000 * best, len(code) / best, distinct, size / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Times parsing and validating a synthetic 10k-line program after small
+edits, as an editor does on every change, with an IncrementalCompiler and
+from scratch. It first checks that both compile every edit that parses to
+the same bytecode and messages, and that both report the syntax errors.
+It also checks that both give the same bytecode, messages and diagnostics
+over runs of random statement-level edits of a small program.
+
+    $ python3 benchmarks/bench_incremental.py
+"""
+import contextlib
+import io
+import random
+import sys
+import time
+
+from common import TABLE_DIR, PROCEDURE, synthetic_program
+
+import LVM
+from compiler import Compiler
+from incremental import IncrementalCompiler
+
+
+def edits(source):
+    """(name, edited source) pairs, in the order an editor would see them."""
+    half = source.count(": proc") // 2
+    middle = source.index("v{0} = v{0} - 1;".format(half))
+    statement = source.index("dcl v{0} int".format(half))
+    yield "change a literal", source[:middle] + source[middle:].replace("- 1;", "- 2;", 1)
+    yield "insert a statement", source[:middle] + "print(0);\n" + source[middle:]
+    yield "break the syntax", source[:middle] + "print(0)\n" + source[middle:]
+    yield "fix the syntax", source[:middle] + "print(1);\n" + source[middle:]
+    yield "add a declaration", source[:statement] + "dcl extra int;\n" + source[statement:]
+    yield "open a comment", source[:middle] + "/* " + source[middle:]
+    yield "close the comment", source[:middle] + "/* */ " + source[middle:]
+    yield "declare at the top", "dcl first int;\n" + source
+
+
+# Statements the random edits put in; the few names make redeclarations,
+# undeclared names and changed symbols common
+STATEMENTS = [
+    "dcl c{0} int = {1};",
+    "dcl c{0}, c{2} int;",
+    "c{0} = c{2} + {1};",
+    "print(c{0}, {1});",
+    "",
+    "if c{0} > {1} then\n  print(c{2});\nfi;",
+    "p{0}: proc (x int) returns (int);\n  dcl c{2} int = x;\n  return c{2} + c{0};\nend;",
+    "print(p{0}(c{2}));",
+]
+
+
+def random_statement(rng):
+    return rng.choice(STATEMENTS).format(rng.randrange(6), rng.randrange(100), rng.randrange(6))
+
+
+def random_edits(seed, count):
+    """Sources a small program goes through, one statement inserted, removed or replaced at a time."""
+    rng = random.Random(seed)
+    statements = [random_statement(rng) for _ in range(30)]
+    yield "\n".join(statements)
+    for _ in range(count):
+        position = rng.randrange(len(statements) + 1)
+        edit = rng.randrange(3)
+        if edit == 0 or len(statements) == position:
+            statements.insert(position, random_statement(rng))
+        elif edit == 1:
+            del statements[position]
+        else:
+            statements[position] = random_statement(rng)
+        yield "\n".join(statements)
+
+
+def differential(seeds, count):
+    """Compares both compilers after every random edit; returns the number of mismatches."""
+    full = Compiler(table_dir=TABLE_DIR, fast_scanner=True)
+    incremental = IncrementalCompiler(table_dir=TABLE_DIR)
+    failures = 0
+    for seed in seeds:
+        for step, source in enumerate(random_edits(seed, count)):
+            expected = compiled(full, source), full.diagnostics()
+            got = compiled(incremental, source), incremental.diagnostics()
+            if got != expected:
+                failures += 1
+                print("MISMATCH in seed {} after edit {}".format(seed, step))
+                break
+    print("{} seeds of {} random edits compared, {} mismatches".format(len(seeds), count, failures))
+    return failures
+
+
+def compiled(compiler, source):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        program = compiler.compile(source)
+    if program is None:
+        return None, output.getvalue()
+    # Labels are numbered differently, decoding resolves them to pcs
+    bytecode = LVM.decode(program)
+    code = (bytecode.code, bytecode.arg1, bytecode.arg2, bytecode.arg3, bytecode.arg4, bytecode.consts)
+    return code, output.getvalue()
+
+
+def timed(compiler, source):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        compiler.check(source)
+    return time.perf_counter() - start
+
+
+def main():
+    # Enough procedures for 10k lines
+    source = synthetic_program(-(-10000 // PROCEDURE.count('\n')))
+    full = Compiler(table_dir=TABLE_DIR)
+    incremental = IncrementalCompiler(table_dir=TABLE_DIR)
+
+    incremental.compile(source)
+    for name, edited in edits(source):
+        expected, got = compiled(full, edited), compiled(incremental, edited)
+        if full.parser.syntax_errors:
+            # Recovery may leave out different statements
+            same = bool(incremental.parser.syntax_errors)
+        else:
+            same = got == expected
+        if not same:
+            print("MISMATCH after: {}".format(name))
+            sys.exit(1)
+    print("incremental output matches for every edit")
+    if differential(range(10), 50):
+        sys.exit(1)
+
+    incremental.compile(source)
+    print("{:>20} {:>10} {:>14} {:>9} {:>11}".format(
+        "edit", "full ms", "incremental ms", "reparsed", "revalidated"))
+    for name, edited in edits(source):
+        full_time = timed(full, edited)
+        incremental_time = timed(incremental, edited)
+        print("{:>20} {:>10.1f} {:>14.1f} {:>9} {:>11}".format(
+            name, 1000 * full_time, 1000 * incremental_time,
+            incremental.reparsed, incremental.revalidated))
+    print("{} lines, {} top-level statements".format(source.count('\n'), len(full.ast.statement_list)))
+
+
+if __name__ == '__main__':
+    main()
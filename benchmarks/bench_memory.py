@@ -0,0 +1,62 @@
+"""
+Measures how much memory the AST of a large synthetic program takes, in
+bytes per node, right after parsing and after validation, which adds the
+symbols and issues. Memory is counted with tracemalloc, so it includes
+the lists and values the nodes hold.
+
+    $ python3 benchmarks/bench_memory.py
+"""
+import contextlib
+import gc
+import io
+import tracemalloc
+
+from common import TABLE_DIR, synthetic_program
+
+from compiler import Compiler
+
+
+def count_nodes(AST):
+    """Nodes in the tree, leaving out the ListNodes children makes up on the fly."""
+    count = 0
+    # Keeps the made up ListNodes alive, so their ids are not reused
+    seen = {}
+    stack = [AST]
+    while stack:
+        current = stack.pop()
+        if id(current) not in seen:
+            seen[id(current)] = current
+            if current.span is not None or current.line_number is not None:
+                count += 1
+            stack.extend(current.children)
+    return count
+
+
+def traced(step):
+    """Runs step() and returns its result and the memory it left allocated."""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = step()
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def main():
+    compiler = Compiler(table_dir=TABLE_DIR)
+    source = synthetic_program(2000)
+    tracemalloc.start()
+    AST, parsed = traced(lambda: compiler.parse(source))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, validated = traced(lambda: compiler.validate(AST))
+    tracemalloc.stop()
+
+    nodes = count_nodes(AST)
+    print("{} lines, {} nodes".format(source.count('\n'), nodes))
+    print("{:>12} {:>10} {:>14}".format("", "MB", "bytes/node"))
+    print("{:>12} {:>10.1f} {:>14.1f}".format("parsed", parsed / 2 ** 20, parsed / nodes))
+    print("{:>12} {:>10.1f} {:>14.1f}".format("validated", (parsed + validated) / 2 ** 20,
+                                              (parsed + validated) / nodes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Parses synthetic programs of up to 100k statements to check that parsing
+time grows linearly with program size. Times are also taken with the
+cyclic garbage collector paused, since its full collections walk the
+whole, growing AST and add a superlinear term of their own.
+
+    $ python3 benchmarks/bench_parser.py
+"""
+import gc
+import time
+
+from common import TABLE_DIR
+
+from lyaparser import PeterParser
+
+
+def synthetic_program(statements):
+    # One declaration list as long as the program, then assignments
+    lines = ["dcl " + ", ".join("v{} int".format(i) for i in range(statements // 10)) + ";"]
+    for i in range(statements):
+        lines.append("v{0} = v{0} + {1};".format(i % (statements // 10), i))
+    return "\n".join(lines)
+
+
+def timed_parse(parser, source):
+    parser.lexer.lexer.lineno = 1
+    start = time.perf_counter()
+    parser.parse(source)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = PeterParser(table_dir=TABLE_DIR)
+    print("{:>10} {:>10} {:>14} {:>14}".format("statements", "seconds", "us/statement", "us/st. no gc"))
+    for statements in (10000, 25000, 50000, 100000):
+        source = synthetic_program(statements)
+        elapsed = timed_parse(parser, source)
+        gc.disable()
+        try:
+            without_gc = timed_parse(parser, source)
+        finally:
+            gc.enable()
+        print("{:>10} {:>10.3f} {:>14.2f} {:>14.2f}".format(
+            statements, elapsed, elapsed / statements * 1e6, without_gc / statements * 1e6))
+
+
+if __name__ == '__main__':
+    main()
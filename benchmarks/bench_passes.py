@@ -0,0 +1,65 @@
+"""
+Times the passes that walk the AST of a large synthetic program after it
+is parsed: validation, printing the errors, listing the diagnostics,
+code generation and the HTML export. Each pass is timed on its own; the
+program is parsed again before every validation.
+
+    $ python3 benchmarks/bench_passes.py
+"""
+import contextlib
+import io
+import time
+
+from common import TABLE_DIR, synthetic_program
+
+from compiler import Compiler
+from visitors import semantic_visitor, DiagnosticVisitor
+from visualization import make_html
+
+# The loop adds up a longer expression, and the if has an elsif
+EXPRESSION = "i * {0} + (s - {0}) * (i + 1)"
+
+
+def best_of(runs, step):
+    """Shortest time of `runs` calls of step(), which returns its start."""
+    best = None
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = step()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    compiler = Compiler(table_dir=TABLE_DIR)
+    source = synthetic_program(2000, EXPRESSION, elsif=True)
+
+    def validate():
+        AST = compiler.parse(source)
+        start = time.perf_counter()
+        compiler.validate(AST)
+        return start
+
+    def timed(step):
+        def run():
+            start = time.perf_counter()
+            step(compiler.ast)
+            return start
+        return run
+
+    passes = [
+        ("validate", validate),
+        ("print errors", timed(semantic_visitor.visit_tree)),
+        ("diagnostics", timed(lambda AST: DiagnosticVisitor().visit_tree(AST))),
+        ("codegen", timed(lambda AST: AST.lvm_visitor())),
+        ("html", timed(make_html)),
+    ]
+    print("{} lines".format(source.count('\n')))
+    print("{:>14} {:>9}".format("pass", "ms"))
+    for name, step in passes:
+        print("{:>14} {:>9.1f}".format(name, 1000 * best_of(5, step)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Checks that FastScanner emits the same tokens and error messages as the
+PLY lexer of LexerLuthor, over the examples, lexical corner cases and a
+synthetic program, then compares their throughput in tokens per second.
+
+    $ python3 benchmarks/bench_scanner.py
+"""
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+from common import ROOT, TABLE_DIR
+
+from lyalex import LexerLuthor
+from scanner import FastScanner
+
+CORNER_CASES = [
+    "a->b - > c-d",
+    "x==y = z <= >= < > != ! && & || |",
+    "'a' '\\n' '\\t' '^(65)' '^(x)' 'ab'",
+    '"a string" "" "unterminated\nnext line',
+    "// comment\r\nline /* block\n\ncomment */ after /",
+    "a /* unterminated\n comment",
+    "1 2\n\n\n3 \t 42abc _x9 ٣٤ é $ ?",
+    "dcl DCL Dcl print Print;",
+    '"unterminated at the end',
+    "7 /**/ 8 /*/ 9 */ 10",
+]
+
+
+def synthetic_program(statements):
+    lines = ["dcl " + ", ".join("v{} int".format(i) for i in range(100)) + ";"]
+    for i in range(statements):
+        lines.append('v{0} = v{0} * 2 + {1}; /* step */ if v{0} >= 10 then print("big", v{0}); fi;'
+                     .format(i % 100, i))
+    return "\n".join(lines)
+
+
+def tokens(lexer, source):
+    """All tokens of `source` as tuples, with the messages printed while lexing."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        lexer.input(source)
+        result = [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in iter(lexer.token, None)]
+    return result, output.getvalue()
+
+
+def differential(luthor, sources):
+    failures = 0
+    for name, source in sources:
+        luthor.lexer.lineno = 1
+        expected = tokens(luthor.lexer, source)
+        got = tokens(FastScanner(), source)
+        if got != expected:
+            failures += 1
+            print("MISMATCH in {}".format(name))
+            for want, have in zip(expected[0] + [None], got[0] + [None]):
+                if want != have:
+                    print("  ply: {}\n  fast: {}".format(want, have))
+                    break
+            if expected[1] != got[1]:
+                print("  ply printed: {!r}\n  fast printed: {!r}".format(expected[1], got[1]))
+    print("{} sources compared, {} mismatches".format(len(sources), failures))
+    return failures == 0
+
+
+def throughput(make_lexer, source, repeat=5):
+    best = None
+    for _ in range(repeat):
+        lexer = make_lexer()
+        start = time.perf_counter()
+        lexer.input(source)
+        count = sum(1 for _ in iter(lexer.token, None))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, count / best
+
+
+def main():
+    luthor = LexerLuthor(table_dir=TABLE_DIR)
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'examples', '*.lya'))):
+        with open(path) as file:
+            sources.append((os.path.basename(path), file.read()))
+    sources += [("corner case {}".format(i), text) for i, text in enumerate(CORNER_CASES)]
+    sources.append(("synthetic", synthetic_program(2000)))
+    if not differential(luthor, sources):
+        sys.exit(1)
+
+    def ply_lexer():
+        luthor.lexer.lineno = 1
+        return luthor.lexer
+
+    source = synthetic_program(20000)
+    print("{:>8} {:>10} {:>14}".format("scanner", "tokens", "tokens/sec"))
+    for name, make_lexer in (("ply", ply_lexer), ("fast", FastScanner)):
+        count, rate = throughput(make_lexer, source)
+        print("{:>8} {:>10} {:>14,.0f}".format(name, count, rate))
+
+
+if __name__ == '__main__':
+    main()
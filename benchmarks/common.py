@@ -0,0 +1,43 @@
+"""
+What the benchmarks share. Importing it puts the repository on sys.path,
+so the scripts import it before any module of the compiler.
+"""
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# The lexer and parser tables, shared with run.py
+TABLE_DIR = os.path.join(ROOT, '__lyacache__')
+
+sys.path.insert(0, ROOT)
+
+# A procedure adding {1} up in a loop, then a call to it and an if on its
+# result; {0} numbers the procedure and {2} is an elsif clause or nothing
+PROCEDURE = """
+p{0}: proc (x int) returns (int);
+  dcl i, s int = 0;
+  do for i = 1 to x;
+    s += {1};
+  od;
+  return s;
+end;
+dcl v{0} int = p{0}({0});
+if v{0} > {0} then
+  v{0} = v{0} - 1;
+{2}else
+  print(v{0});
+fi;
+"""
+
+ELSIF = """elsif v{0} < 0 then
+  print(v{0}, "negative");
+"""
+
+
+def synthetic_program(procedures, expression="i * {0}", elsif=False):
+    """
+    `procedures` numbered copies of PROCEDURE. `expression` is what the
+    loop adds up, {0} in it standing for the number of the procedure.
+    """
+    return "".join(PROCEDURE.format(i, expression.format(i), ELSIF.format(i) if elsif else "")
+                   for i in range(procedures))
@@ -0,0 +1,143 @@
+from abc import ABC, abstractmethod
+import io
+import sys
+
+
+class OutputSink(ABC):
+    """
+    Receives the text printed by the LVM. The LVM flushes it when the
+    program ends, before every read and when a run stops, so a prompt is
+    always visible before the program waits for its answer.
+    """
+    @abstractmethod
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+class StreamSink(OutputSink):
+    """
+    Buffers text for a file-like stream, sys.stdout by default. The flush
+    policy follows setvbuf: 'full' only writes once `buffer_size`
+    characters are pending, 'line' writes every complete line and
+    'unbuffered' writes each piece right away.
+    """
+    FLUSH_POLICIES = ('full', 'line', 'unbuffered')
+
+    def __init__(self, stream=None, flush='full', buffer_size=4096):
+        if flush not in self.FLUSH_POLICIES:
+            raise ValueError("unknown flush policy {!r}".format(flush))
+        self.stream = stream
+        self.policy = flush
+        self.buffer_size = 1 if flush == 'unbuffered' else buffer_size
+        self.pending = []
+        # Characters in pending
+        self.size = 0
+
+    def write(self, text):
+        self.pending.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size or (self.policy == 'line' and '\n' in text):
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        # Looked up here so that redirecting sys.stdout after the LVM was
+        # built still captures its output
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(''.join(self.pending))
+        stream.flush()
+        self.pending = []
+        self.size = 0
+
+
+class StringSink(OutputSink):
+    """Keeps the output in memory, for embedding the LVM."""
+    def __init__(self):
+        self.buffer = io.StringIO()
+
+    def write(self, text):
+        self.buffer.write(text)
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+def convert_value(text):
+    """What rdv pushes for a line of input: 1 or 0 for TRUE and FALSE,
+    an int when it parses as one and the text itself otherwise."""
+    if text == "TRUE" or text == "FALSE":
+        return int(text == "TRUE")
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+class InputSource(ABC):
+    """
+    Supplies the values read by rdv and the strings read by rds. Running
+    out of input raises EOFError, as input() does.
+    """
+    def read_value(self):
+        return convert_value(self.read_string())
+
+    @abstractmethod
+    def read_string(self):
+        pass
+
+
+class ConsoleSource(InputSource):
+    """Reads one line per read with input(), for interactive runs."""
+    def read_string(self):
+        return input()
+
+
+class BufferSource(InputSource):
+    """
+    Splits a whole input at once, from a str, bytes or a file object such
+    as sys.stdin, and converts every token for rdv in one pass. Tokens are
+    lines, as read by input(), or any whitespace separated words when
+    `words` is set.
+    """
+    def __init__(self, data, words=False, encoding='utf-8'):
+        if hasattr(data, 'read'):
+            data = data.read()
+        if isinstance(data, bytes):
+            data = data.decode(encoding)
+        if words:
+            self.tokens = data.split()
+        else:
+            # Universal newlines, like a text mode sys.stdin
+            self.tokens = io.StringIO(data, newline=None).read().split('\n')
+            if self.tokens[-1] == '':
+                self.tokens.pop()
+        self.values = [convert_value(token) for token in self.tokens]
+        self.position = 0
+
+    def next_index(self):
+        i = self.position
+        if i >= len(self.tokens):
+            raise EOFError("EOF when reading a line")
+        self.position = i + 1
+        return i
+
+    def read_value(self):
+        return self.values[self.next_index()]
+
+    def read_string(self):
+        return self.tokens[self.next_index()]
+
+
+class ListSource(BufferSource):
+    """
+    Feeds pre-supplied values. Strings go through the same conversion as
+    typed input; any other value is pushed by rdv as it is.
+    """
+    def __init__(self, values):
+        self.tokens = [value if isinstance(value, str) else str(value) for value in values]
+        self.values = [convert_value(value) if isinstance(value, str) else value for value in values]
+        self.position = 0
@@ -0,0 +1,126 @@
+from lyaparser import PeterParser
+from lyalex import StreamingLexer
+from helpers import LineIndex
+from scanner import FastScanner
+from visitors import semantic_visitor, DiagnosticVisitor
+from optimizer import PeepholeOptimizer
+from environments import cur_context
+from channels import InputSource, ConsoleSource, BufferSource, ListSource
+from LVM import LVM
+
+
+class Compiler:
+    """
+    A compilation session. It builds the lexer and parser once and starts
+    every compilation from a fresh Context, so one process can compile any
+    number of programs back to back. The Context is the module-wide
+    cur_context the AST nodes use, so sessions must not compile
+    concurrently in the same process.
+
+    With fast_scanner, str sources are tokenized by the hand-written
+    FastScanner instead of the PLY lexer.
+    """
+    def __init__(self, optimize=True, table_dir=None, report_errors=True, fast_scanner=False):
+        self.parser = PeterParser(table_dir=table_dir)
+        self.lexer = self.parser.lexer
+        self.context = cur_context
+        self.optimizer = PeepholeOptimizer() if optimize else None
+        self.report_errors = report_errors
+        self.fast_scanner = fast_scanner
+        # AST of the last compilation, kept for diagnostics and visualization
+        self.ast = None
+
+    def parse(self, source):
+        """
+        Parses a str, or streams a file, a memory-mapped file or an iterable
+        of chunks through the lexer without reading it whole.
+        """
+        self.context.reset()
+        if isinstance(source, str):
+            self.context.lines = LineIndex(source)
+        if isinstance(source, str) and self.fast_scanner:
+            self.ast = self.parser.parse(source, lexer=FastScanner())
+        elif isinstance(source, str):
+            self.lexer.lexer.lineno = 1
+            self.ast = self.parser.parse(source)
+        else:
+            self.ast = self.parser.parse(lexer=StreamingLexer(self.lexer, source))
+        return self.ast
+
+    def compile(self, source):
+        """
+        Returns the LVM program for `source`, or None if it is invalid. The
+        source can be anything parse() accepts. A program with syntax errors
+        is only parsed and checked, as far as it parsed.
+        """
+        AST = self.check(source)
+        if not AST or self.parser.syntax_errors:
+            return None
+        if self.report_errors:
+            semantic_visitor.visit_tree(AST)
+        if not AST.is_valid:
+            return None
+        program = AST.lvm_visitor()
+        if self.optimizer is not None:
+            program = self.optimizer.optimize(program)
+        return program
+
+    def check(self, source):
+        """
+        Parses and validates `source` without generating code, as an editor
+        does on every change. Returns the AST, or None if it did not parse.
+        """
+        AST = self.parse(source)
+        if AST:
+            self.validate(AST)
+        return AST
+
+    def diagnostics(self):
+        """
+        The syntax errors and semantic issues of the last compilation, as
+        DiagnosticVisitor lists them.
+        """
+        lines = self.context.lines
+        diagnostics = []
+        for issue in self.parser.syntax_errors:
+            line, column = issue.line_number, None
+            if lines is not None and issue.lexpos is not None:
+                line, column = lines.position(issue.lexpos)
+            diagnostics.append({
+                'type': issue.issue_type.name,
+                'line': line,
+                'column': column,
+                'node': 'syntax',
+                'message': issue.message(),
+            })
+        if self.ast:
+            visitor = DiagnosticVisitor()
+            visitor.visit_tree(self.ast)
+            diagnostics += visitor.diagnostics
+        return diagnostics
+
+    def validate(self, AST):
+        """Runs the semantic checks over a parsed program."""
+        return AST.validation_visitor()
+
+    def run(self, program, stdin=None, jit=False, **options):
+        """
+        Runs `program` and returns the LVM it ran on. `stdin` can be an
+        InputSource, a list of values, or a str, bytes or file with the
+        whole input; by default input is read from the console. The other
+        options are passed on to the LVM.
+        """
+        if stdin is None:
+            source = ConsoleSource()
+        elif isinstance(stdin, InputSource):
+            source = stdin
+        elif isinstance(stdin, (list, tuple)):
+            source = ListSource(stdin)
+        else:
+            source = BufferSource(stdin)
+        lvm = LVM(program, input=source, **options)
+        if jit:
+            lvm.run_compiled()
+        else:
+            lvm.run()
+        return lvm
@@ -1,4 +1,4 @@
-from case_ins_dict import CaseInsensitiveDict
+import sys
 from enum import Enum
 
 
@@ -69,11 +69,13 @@ class ProcedureSymbol(Symbol):
     def __init__(self, name, mode: ExprType,
                  start_label: int =None,
                  formal_params: list =None,
-                 builtin: bool =False):
+                 builtin: bool =False,
+                 declaration=None):
         super().__init__(name, mode, SymbolCategory.PROCEDURE)
         self.start_label = start_label
         self.formal_params = formal_params
         self.builtin = builtin
+        self.declaration = declaration
 
     @property
     def num_args(self):
@@ -101,24 +103,34 @@ string_symbol = BuiltinSymbol("string", ExprType("string", char_symbol.expr_type
 void_symbol = BuiltinSymbol("void", ExprType("void"), SymbolCategory.MODE)
 
 
-class SymbolTable(CaseInsensitiveDict):
+def symbol_key(name: str) -> str:
+    """
+    Key of `name` in the symbol tables. Names are case insensitive, so the
+    key is lowered; it is also interned, so tables find it by identity.
+    Nodes with a name work it out once, when they are built.
+    """
+    return sys.intern(name.lower())
+
+
+class SymbolTable(dict):
     """
     Class representing a symbol table. It should
     provide functionality for adding and looking
-    up nodes associated with identifiers.
+    up nodes associated with identifiers. It is a
+    plain dict from symbol_key() keys to symbols.
     """
     def __init__(self, decl=None):
         super().__init__()
         self.decl = decl
         self.next_offset = 0
 
-    def add(self, name: str, value: Symbol):
-        if name in self:
+    def add(self, key: str, value: Symbol):
+        if key in self:
             print("WARNING reassigning symbol")
-        self[name] = value
+        self[key] = value
 
-    def lookup(self, name):
-        return self.get(name, None)
+    def lookup(self, key):
+        return self.get(key)
 
     def return_type(self):
         if self.decl:
@@ -127,7 +139,11 @@ class SymbolTable(CaseInsensitiveDict):
 
 
 class Environment(object):
-    def __init__(self, root_dict: CaseInsensitiveDict=None):
+    """
+    The scopes open at a point of the program, innermost last. Every
+    method takes names as symbol_key() keys.
+    """
+    def __init__(self, root_dict: dict=None):
         self.stack = []
         self.root = SymbolTable()
         self.stack.append(self.root)
@@ -146,28 +162,25 @@ class Environment(object):
     def scope_level(self):
         return len(self.stack)
 
-    def add_local(self, name, symbol: Symbol, offset=None, level=None):
+    def add_local(self, key, symbol: Symbol, offset=None, level=None):
         symbol.offset = offset or self.peek().next_offset
         symbol.display_level = level or self.scope_level() - 1
-        self.peek().add(name, symbol)
+        self.peek().add(key, symbol)
         if symbol.category == SymbolCategory.VARIABLE:
             self.peek().next_offset += symbol.size
 
-    def add_root(self, name, value):
-        self.root.add(name, value)
+    def add_root(self, key, value):
+        self.root.add(key, value)
 
-    def lookup(self, name):
+    def lookup(self, key):
         for scope in reversed(self.stack):
-            hit = scope.lookup(name)
+            hit = scope.get(key)
             if hit is not None:
                 return hit
         return None
 
-    def find(self, name):
-        if name in self.stack[-1]:
-            return True
-        else:
-            return False
+    def find(self, key):
+        return key in self.stack[-1]
 
 
 class Context:
@@ -175,23 +188,31 @@ class Context:
         self.label_count = 0
         self.symbol_env = self.get_default_mode_env()
         self.function_stack = []
+        # LineIndex of the source being compiled, when it is held whole
+        self.lines = None
+
+    def reset(self):
+        # node.py imports cur_context by name, so a new program starts over
+        # in the same instance instead of replacing it
+        self.__init__()
 
     @staticmethod
     def get_default_mode_env():
-        return Environment(CaseInsensitiveDict({
-            int_symbol.name: int_symbol,
-            char_symbol.name: char_symbol,
-            string_symbol.name: string_symbol,
-            bool_symbol.name: bool_symbol,
-            void_symbol.name: void_symbol,
-            'ABS': ProcedureSymbol('ABS', int_symbol.expr_type, builtin=True),
-            'ASC': ProcedureSymbol('ASC', int_symbol.expr_type, builtin=True),
-            'UPPER': ProcedureSymbol('UPPER', int_symbol.expr_type, builtin=True),
-            'LOWER': ProcedureSymbol('LOWER', int_symbol.expr_type, builtin=True),
-            'NUM': ProcedureSymbol('NUM', int_symbol.expr_type, builtin=True),
-            'READ': ProcedureSymbol('READ', void_symbol.expr_type, builtin=True),
-            'PRINT': ProcedureSymbol('PRINT', void_symbol.expr_type, builtin=True),
-        }))
+        builtins = [
+            int_symbol,
+            char_symbol,
+            string_symbol,
+            bool_symbol,
+            void_symbol,
+            ProcedureSymbol('ABS', int_symbol.expr_type, builtin=True),
+            ProcedureSymbol('ASC', int_symbol.expr_type, builtin=True),
+            ProcedureSymbol('UPPER', int_symbol.expr_type, builtin=True),
+            ProcedureSymbol('LOWER', int_symbol.expr_type, builtin=True),
+            ProcedureSymbol('NUM', int_symbol.expr_type, builtin=True),
+            ProcedureSymbol('READ', void_symbol.expr_type, builtin=True),
+            ProcedureSymbol('PRINT', void_symbol.expr_type, builtin=True),
+        ]
+        return Environment({symbol_key(symbol.name): symbol for symbol in builtins})
 
     def insert_symbol(self,
                       var_list,
@@ -206,18 +227,16 @@ class Context:
         valid_identifiers = True
 
         for identifier in var_list:
-            prev = self.symbol_env.find(identifier.name)
+            prev = self.symbol_env.find(identifier.key)
             if prev:
                 # Verifica se variável já foi declarada
-                prev_var = self.symbol_env.lookup(identifier.name)
-                line_number = prev_var.declaration.line_number if prev_var.declaration else None
-
-                identifier.issues.append(VariableRedeclaration(identifier.name, line_number))
+                prev_var = self.symbol_env.lookup(identifier.key)
+                identifier.add_issue(VariableRedeclaration(identifier.name, prev_var.declaration))
                 identifier.__is_valid__ = False
                 valid_identifiers = False
             else:
                 s = VarSymbol(identifier.name, var_mode, category, declaration, size=size)
-                self.symbol_env.add_local(identifier.name, s)
+                self.symbol_env.add_local(identifier.key, s)
                 identifier.symbol = s
 
         return valid_identifiers
@@ -226,19 +245,21 @@ class Context:
                          start_label, declaration, formal_params,
                          display_level=1):
         from errors import VariableRedeclaration
-        prev = self.symbol_env.find(proc_id_node.name)
+        # A redeclared procedure is not added, but its body is still checked
+        # in a scope of its own
+        s = ProcedureSymbol(proc_id_node.name, ret_type,
+                            start_label=start_label,
+                            formal_params=formal_params,
+                            declaration=declaration)
+        prev = self.symbol_env.find(proc_id_node.key)
         if prev:
-            prev_var = self.symbol_env.lookup(proc_id_node.name)
-            line_number = prev_var.declaration.line_number if prev_var.declaration else None
-            proc_id_node.issues.append(VariableRedeclaration(proc_id_node.name, line_number))
+            prev_var = self.symbol_env.lookup(proc_id_node.key)
+            proc_id_node.add_issue(VariableRedeclaration(proc_id_node.name, prev_var.declaration))
             proc_id_node.__is_valid__ = False
-            return None
+            s.display_level = display_level
         else:
-            s = ProcedureSymbol(proc_id_node.name, ret_type,
-                                start_label=start_label,
-                                formal_params=formal_params)
-            self.symbol_env.add_local(proc_id_node.name, s, level=display_level)
-            return s
+            self.symbol_env.add_local(proc_id_node.key, s, level=display_level)
+        return s
 
 
 cur_context = Context()
@@ -70,10 +70,15 @@ class UndeclaredVariable(SemanticError):
 
 
 class VariableRedeclaration(SemanticError):
-    def __init__(self, var_name, prev_decl_line):
+    def __init__(self, var_name, prev_declaration):
         super().__init__()
         self.var_name = var_name
-        self.prev_decl_line = prev_decl_line
+        # The node, not its line, which changes when an editor moves it
+        self.prev_declaration = prev_declaration
+
+    @property
+    def prev_decl_line(self):
+        return self.prev_declaration.line_number if self.prev_declaration else None
 
     def message(self):
         return "\"{}\" already declarated on line {}".format(
@@ -100,4 +105,19 @@ class ArgCountError(SemanticError):
     def message(self):
         return "Expected {} argument for procedure {}, but received {}".format(
             self.expected_num, self.func_name, self.received_num
-        )
\ No newline at end of file
+        )
+
+
+class UnexpectedToken(SemanticIssue):
+    """A syntax error: the token the parser could not take, or the end of input."""
+    def __init__(self, token_type, value, line_number, lexpos=None):
+        super().__init__(IssueType.ERROR)
+        self.token_type = token_type
+        self.value = value
+        self.line_number = line_number
+        self.lexpos = lexpos
+
+    def message(self):
+        if self.token_type is None:
+            return "unexpected end of input"
+        return "unexpected {} '{}'".format(self.token_type, self.value)
@@ -2,6 +2,58 @@ def print_error(type, lineno, error_msg):
     print("ERROR ({}) on line {}: {}".format(type, lineno, error_msg))
 
 
+class LineIndex(object):
+    """
+    Turns offsets into a source into (line, column) pairs, both counted
+    from 1. The offsets where lines start are only collected the first
+    time a position is asked for, so sources without errors never pay
+    for it.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.starts = None
+
+    def position(self, offset):
+        from bisect import bisect_right
+        if self.starts is None:
+            import re
+            self.starts = [0] + [match.end() for match in re.finditer('\n', self.source)]
+        line = bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
+
+
+def table_signature(module, prefix):
+    """
+    Hash of everything PLY builds its tables from: the token list, the
+    precedence and states, and the regex or production of every rule whose
+    name starts with `prefix`. Rule bodies do not change the tables.
+    """
+    import hashlib
+    parts = []
+    for name in sorted(dir(module)):
+        if name.startswith(prefix) or name in ('tokens', 'literals', 'states', 'precedence', 'start'):
+            value = getattr(module, name)
+            parts.append("{}={}".format(name, value.__doc__ if callable(value) else repr(value)))
+    return hashlib.sha1("\n".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def load_table(table_dir, name):
+    """
+    The PLY table module `name` saved in `table_dir`, or just its name when
+    it was not built yet, in which case PLY builds and writes it there.
+    """
+    import importlib.util
+    import os
+    path = os.path.join(table_dir, name + '.py')
+    if not os.path.exists(path):
+        os.makedirs(table_dir, exist_ok=True)
+        return name
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
 def get_data():
     import sys
     data = ""
@@ -0,0 +1,303 @@
+"""
+Incremental compilation for editors: after an edit only the top-level
+statements the edit touched are lexed and parsed again, and only the
+statements whose symbols changed are validated again.
+
+    compiler = IncrementalCompiler()
+    compiler.compile(source)
+    compiler.compile(edited_source)
+"""
+from bisect import bisect_left, bisect_right
+
+import node
+from compiler import Compiler
+from environments import Environment
+from helpers import LineIndex
+from scanner import FastScanner
+
+
+def common_prefix(a, b):
+    """Length of the longest common prefix, found by comparing slices."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def common_suffix(a, b, limit):
+    """Length of the longest common suffix, at most `limit`."""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class RegionLexer(object):
+    """
+    Lexer for PeterParser.parse over the edited part of a source. It scans
+    from `start` and stops before the first token found exactly at one of
+    `boundaries`, the new offsets of the statements that followed the edit:
+    from there on the source lexes as it did before. `resume` is then the
+    index of that statement in `boundaries`.
+    """
+    def __init__(self, source, start, lineno, boundaries):
+        self.scanner = FastScanner()
+        self.scanner.lineno = lineno
+        self.scanner.input(source, start)
+        self.boundaries = boundaries
+        self.resume = 0
+        # One token is read ahead, so the line the parser sees is kept
+        # apart from the scanner's
+        self.lineno = lineno
+        self.pending = self.next_token()
+
+    def next_token(self):
+        tok = self.scanner.token()
+        boundaries = self.boundaries
+        while self.resume < len(boundaries):
+            if tok is None:
+                self.resume = len(boundaries)
+            elif tok.lexpos == boundaries[self.resume]:
+                return None
+            elif tok.lexpos > boundaries[self.resume]:
+                # A comment or string the edit opened ran over it
+                self.resume += 1
+            else:
+                break
+        return tok
+
+    @property
+    def empty(self):
+        return self.pending is None
+
+    def token(self):
+        tok = self.pending
+        if tok is None:
+            self.lineno = self.scanner.lineno
+        else:
+            self.lineno = tok.lineno
+            self.pending = self.next_token()
+        return tok
+
+
+class Dependencies(object):
+    """
+    What validating a top-level statement read from and added to the root
+    scope, by symbol key. While the keys in `reads` still resolve to the
+    same symbols and the next variable offset is the same, validating it
+    again would give the same result.
+    """
+    def __init__(self, offset, reads, defines, next_offset):
+        self.offset = offset
+        self.reads = reads
+        self.defines = defines
+        self.next_offset = next_offset
+
+    def unchanged(self, root):
+        if root.next_offset != self.offset:
+            return False
+        for key, symbol in self.reads.items():
+            if root.get(key) is not symbol:
+                return False
+        return True
+
+    def replay(self, root):
+        for key, symbol in self.defines:
+            root[key] = symbol
+        root.next_offset = self.next_offset
+
+
+class RecordingEnvironment(Environment):
+    """
+    Environment that notes the names resolved in the root scope, as first
+    seen, and the symbols declared there, for Dependencies.
+    """
+    def __init__(self, root_dict=None):
+        super().__init__(root_dict)
+        self.reads = {}
+        self.defines = []
+
+    def lookup(self, key):
+        for scope in reversed(self.stack[1:]):
+            hit = scope.get(key)
+            if hit is not None:
+                return hit
+        hit = self.root.get(key)
+        self.reads.setdefault(key, hit)
+        return hit
+
+    def find(self, key):
+        if len(self.stack) == 1:
+            self.reads.setdefault(key, self.root.get(key))
+        return super().find(key)
+
+    def add_local(self, key, symbol, offset=None, level=None):
+        super().add_local(key, symbol, offset, level)
+        if len(self.stack) == 1:
+            self.defines.append((key, symbol))
+
+
+def subtree(statement):
+    """Every node of a statement, each once."""
+    nodes = []
+    # Maps ids to the nodes themselves, so the ListNodes children makes up
+    # stay alive and their ids are not taken by the next ones
+    seen = {}
+    stack = [statement]
+    while stack:
+        current = stack.pop()
+        if id(current) not in seen:
+            seen[id(current)] = current
+            # Skips the ListNodes children makes up on the fly
+            if current.span is not None or current.line_number is not None:
+                nodes.append(current)
+            stack.extend(current.children)
+    return nodes
+
+
+class IncrementalCompiler(Compiler):
+    """
+    A Compiler that keeps the last program that parsed and reuses what an
+    edit did not touch. The edit is found by comparing the new source with
+    the old one; the top-level statements around it are lexed and parsed
+    again, since a statement ending in SEMI lexes and parses the same
+    whatever follows it, and the ones after it are kept, moved by the
+    length of the edit. Statements that do not parse are left out, as the
+    parser does, and the part of the source they came from is parsed again
+    with every later edit until it parses.
+
+    Labels keep being numbered from where the last parse left them, so the
+    labels of kept statements stay unique.
+    """
+    def __init__(self, optimize=True, table_dir=None, report_errors=True):
+        super().__init__(optimize, table_dir, report_errors, fast_scanner=True)
+        # Last source, the AST the next edit starts from and the range of
+        # that source that had syntax errors
+        self.source = None
+        self.tree = None
+        self.dirty = None
+        # Symbols every validation starts from, kept so statements reading
+        # only builtins are still seen as unchanged
+        self.builtins = self.context.get_default_mode_env().root
+        self.dependencies = {}
+        # Nodes of the kept statements, listed the first time they move
+        self.nodes = {}
+        # First label not used by the last tree; the Context is shared with
+        # other compilers, which start it over
+        self.labels = 0
+        # Statements parsed and validated again by the last compilation
+        self.reparsed = 0
+        self.revalidated = 0
+
+    def parse(self, source):
+        if self.tree is not None and isinstance(source, str):
+            AST = self.reparse(source)
+        else:
+            AST = super().parse(source)
+            self.dependencies = {}
+            self.nodes = {}
+            self.labels = 0
+            self.reparsed = len(AST.statement_list) if AST else 0
+            self.dirty = (0, len(source)) if self.parser.syntax_errors and AST else None
+        self.labels = max(self.labels, self.context.label_count)
+        self.ast = AST
+        if AST is not None and isinstance(source, str):
+            self.source, self.tree = source, AST
+        else:
+            self.source, self.tree = None, None
+        return AST
+
+    def reparse(self, source):
+        old, old_ast = self.source, self.tree
+        statements = old_ast.statement_list
+        prefix = common_prefix(old, source)
+        suffix = common_suffix(old, source, min(len(old), len(source)) - prefix)
+        if self.dirty is not None:
+            # Parsed again until it parses without errors
+            prefix = min(prefix, self.dirty[0])
+            suffix = min(suffix, len(old) - self.dirty[1])
+        offset = len(source) - len(old)
+
+        # Statements ending before the edit are kept; the others are parsed
+        # again up to the first one that starts after it and still lexes
+        # from its first token as it did
+        ends = [statement.span[1] + 1 for statement in statements]
+        starts = [statement.span[0] for statement in statements]
+        first = bisect_right(ends, prefix)
+        after = max(bisect_left(starts, len(old) - suffix), first)
+        start = ends[first - 1] if first else 0
+        lineno = source.count('\n', 0, start) + 1
+        boundaries = [position + offset for position in starts[after:]]
+        self.context.label_count = self.labels
+        region = RegionLexer(source, start, lineno, boundaries)
+
+        parsed = []
+        self.parser.syntax_errors = []
+        if not region.empty:
+            program = self.parser.parse(lexer=region)
+            if isinstance(program, node.Program):
+                parsed = program.statement_list
+        resume = after + region.resume
+        kept = statements[resume:]
+        if self.parser.syntax_errors:
+            self.dirty = (start, boundaries[region.resume] if kept else len(source))
+        else:
+            self.dirty = None
+
+        lines = source.count('\n', prefix, len(source) - suffix) - old.count('\n', prefix, len(old) - suffix)
+        if offset or lines:
+            for statement in kept:
+                nodes = self.nodes.get(statement)
+                if nodes is None:
+                    nodes = self.nodes[statement] = subtree(statement)
+                for current in nodes:
+                    if current.span is not None:
+                        current.span = (current.span[0] + offset, current.span[1] + offset)
+                    if current.line_number is not None:
+                        current.line_number += lines
+        for statement in statements[first:resume]:
+            self.nodes.pop(statement, None)
+
+        self.context.lines = LineIndex(source)
+        AST = node.Program(old_ast.line_number + lines, statements[:first] + parsed + kept)
+        if AST.statement_list:
+            AST.span = (AST.statement_list[0].span[0], AST.statement_list[-1].span[1])
+        self.reparsed = len(parsed)
+        return AST
+
+    def validate(self, AST):
+        """
+        Validates the statements in order, skipping those whose symbols are
+        unchanged and only putting back what they declared.
+        """
+        environment = RecordingEnvironment(self.builtins)
+        self.context.symbol_env = environment
+        self.context.function_stack = []
+        root = environment.root
+        dependencies = {}
+        valid = True
+        self.revalidated = 0
+        for statement in AST.statement_list:
+            known = self.dependencies.get(statement)
+            if known is not None and known.unchanged(root):
+                known.replay(root)
+            else:
+                environment.reads = {}
+                environment.defines = []
+                before = root.next_offset
+                statement.validation_visitor()
+                known = Dependencies(before, environment.reads, environment.defines, root.next_offset)
+                self.revalidated += 1
+            dependencies[statement] = known
+            valid = valid and statement.is_valid
+        self.dependencies = dependencies
+        AST.__is_valid__ = valid
+        return valid
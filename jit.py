@@ -0,0 +1,363 @@
+"""
+Compiles linked LVM bytecode to a Python function. Every basic block
+becomes a run of Python statements, selected by a `while True` loop that
+dispatches on the pc the block starts at. Within a block the stack pointer
+is tracked at compile time, so instructions index M at constant offsets
+from `sp` instead of updating it one push at a time.
+
+The generated code writes exactly the cells the interpreter writes, so the
+memory, the stack and the output of both engines are identical.
+"""
+from functools import lru_cache
+
+import LVM
+
+# Python spelling of each binary opcode, as applied by BINARY_OPERATORS
+BINARY_SYMBOLS = {
+    LVM.ADD: '+', LVM.SUB: '-', LVM.MUL: '*', LVM.DIV: '//', LVM.MOD: '%',
+    LVM.AND: '&', LVM.OR: '|', LVM.LES: '<', LVM.LEQ: '<=', LVM.GRT: '>',
+    LVM.GTE: '>=', LVM.EQU: '==', LVM.NEQ: '!=',
+}
+
+# Instructions after which control does not simply fall through
+BLOCK_ENDS = {LVM.JOF, LVM.JMP, LVM.CJF, LVM.JNL, LVM.CFU, LVM.RET}
+
+# Leaves of the dispatch tree compare the block id one by one
+DISPATCH_LEAF_SIZE = 4
+
+# Compiled functions kept for programs run again by a new LVM
+CACHE_SIZE = 32
+
+
+def block_leaders(bytecode):
+    """Sorted pcs at which a basic block starts."""
+    leaders = {0}
+    for pc, opcode in enumerate(bytecode.code):
+        if opcode in BLOCK_ENDS:
+            leaders.add(pc + 1)
+        if pc in bytecode.jump_labels:
+            # A jump sets pc to the label slot, which is then incremented
+            leaders.add(bytecode.label_to_pc[bytecode.jump_labels[pc]] + 1)
+    return sorted(leader for leader in leaders if leader < len(bytecode))
+
+
+class BlockCompiler:
+    """
+    Emits the statements of one basic block. `off` is the distance between
+    the runtime `sp` and the stack pointer the interpreter would have at the
+    current instruction; it is committed to `sp` before any instruction
+    that needs the real value.
+    """
+    def __init__(self, bytecode, start, stop):
+        self.bytecode = bytecode
+        self.start = start
+        self.stop = stop
+        self.lines = []
+        self.off = 0
+        # Frame bases read into locals, valid until D changes
+        self.bases = set()
+        # Index of the memory guard of the current segment, how far sp has
+        # moved since it and the highest cell above its sp written since
+        self.guard = None
+        self.shift = 0
+        self.highest = 0
+
+    def emit(self, line):
+        self.lines.append(line)
+
+    def slot(self, i):
+        i += self.off
+        if i == 0:
+            return "sp"
+        return "sp {} {}".format('+' if i > 0 else '-', abs(i))
+
+    def push(self, expression):
+        self.emit("M[{}] = {}".format(self.slot(1), expression))
+        self.off += 1
+        self.written(0)
+
+    def written(self, i):
+        self.highest = max(self.highest, self.shift + self.off + i)
+
+    def move(self, count):
+        self.emit("sp += {}".format(count) if count >= 0 else "sp -= {}".format(-count))
+        self.shift += count
+
+    def commit(self):
+        if self.off:
+            self.move(self.off)
+            self.off = 0
+
+    def base(self, level):
+        # D only changes through enf, ret and stp
+        if level not in self.bases:
+            self.emit("d{0} = D[{0}]".format(level))
+            self.bases.add(level)
+        return "d{}".format(level)
+
+    def address(self, level, offset):
+        return "{} + {}".format(self.base(level), offset)
+
+    def const(self, index):
+        value = self.bytecode.consts[index]
+        if type(value) in (int, bool):
+            return repr(value)
+        return "consts[{}]".format(index)
+
+    def start_segment(self):
+        # The interpreter grows the memory when a push runs past its end;
+        # here the room a segment needs is reserved once, before it runs
+        self.close_segment()
+        self.guard = len(self.lines)
+        self.emit(None)
+        self.shift = 0
+        self.highest = 0
+
+    def close_segment(self):
+        if self.guard is None:
+            return
+        if self.highest > 0:
+            self.lines[self.guard] = "if sp + {0} >= len(M): M = memory.ensure(sp + {1})".format(
+                self.highest, self.highest + 1)
+        else:
+            del self.lines[self.guard]
+        self.guard = None
+
+    def jump(self, target):
+        """Block id a jump to the label slot `target` continues at."""
+        return target + 1
+
+    def compile(self):
+        self.start_segment()
+        bc = self.bytecode
+        next_block = self.stop
+        for pc in range(self.start, self.stop):
+            op = bc.code[pc]
+            a1, a2, a3, a4 = bc.arg1[pc], bc.arg2[pc], bc.arg3[pc], bc.arg4[pc]
+            if op == LVM.LDC:
+                self.push(self.const(a1))
+            elif op == LVM.LDV:
+                self.push("M[{}]".format(self.address(a1, a2)))
+            elif op == LVM.LDR:
+                self.push(self.address(a1, a2))
+            elif op == LVM.STV:
+                self.emit("M[{}] = M[{}]".format(self.address(a1, a2), self.slot(0)))
+                self.off -= 1
+            elif op == LVM.SRV:
+                self.emit("M[M[{}]] = M[{}]".format(self.address(a1, a2), self.slot(0)))
+                self.off -= 1
+            elif op == LVM.LRV:
+                self.push("M[M[{}]]".format(self.address(a1, a2)))
+            elif op == LVM.ALC:
+                self.off += a1
+                self.written(0)
+            elif op == LVM.DLC:
+                self.off -= a1
+            elif op in BINARY_SYMBOLS:
+                self.emit("M[{0}] = M[{0}] {1} M[{2}]".format(self.slot(-1), BINARY_SYMBOLS[op], self.slot(0)))
+                self.off -= 1
+            elif op == LVM.NEG:
+                self.emit("M[{0}] = -M[{0}]".format(self.slot(0)))
+            elif op == LVM.ABS:
+                self.emit("M[{0}] = abs(M[{0}])".format(self.slot(0)))
+            elif op == LVM.NOT:
+                self.emit("M[{0}] = not M[{0}]".format(self.slot(0)))
+            elif op == LVM.GRC:
+                self.emit("M[{0}] = M[M[{0}]]".format(self.slot(0)))
+            elif op == LVM.IDX:
+                self.emit("M[{}] += M[{}] * {}".format(self.slot(-1), self.slot(0), a1))
+                self.off -= 1
+            elif op == LVM.INC:
+                self.emit("M[{}] += {}".format(self.address(a1, a2), self.const(a3)))
+            elif op == LVM.LXV:
+                self.emit("M[{0}] = M[M[{0}] + M[{1}] * {2}]".format(self.slot(-1), self.slot(0), a1))
+                self.off -= 1
+            elif op == LVM.LCB:
+                self.push("M[{}] {} {}".format(self.address(a1, a2), BINARY_SYMBOLS[a4], self.const(a3)))
+            elif op == LVM.LLB:
+                base = self.base(a1)
+                self.push("M[{0} + {1}] {2} M[{0} + {3}]".format(base, a2, BINARY_SYMBOLS[a4], a3))
+            elif op == LVM.LMV and a1 == 1:
+                self.emit("M[{0}] = M[M[{0}]]".format(self.slot(0)))
+            elif op == LVM.SMV and a1 == 1:
+                self.emit("M[M[{}]] = M[{}]".format(self.slot(-1), self.slot(0)))
+                self.off -= 2
+            elif op == LVM.ENF:
+                self.push("D[{}]".format(a1))
+                self.emit("D[{}] = {}".format(a1, self.slot(1)))
+                self.bases.discard(a1)
+            elif op == LVM.STP:
+                self.emit("sp = -1")
+                self.emit("D[0] = 0")
+                self.off = 0
+                self.bases.discard(0)
+                self.start_segment()
+            elif op == LVM.END:
+                self.emit("flush()")
+            elif op == LVM.NOP:
+                pass
+            elif op == LVM.JMP:
+                self.commit()
+                next_block = self.jump(a1)
+            elif op == LVM.JOF:
+                condition = "M[{}]".format(self.slot(0))
+                self.off -= 1
+                self.branch(condition, a1)
+                next_block = None
+            elif op == LVM.CJF:
+                condition = "M[{}] {} M[{}]".format(self.slot(-1), BINARY_SYMBOLS[a2], self.slot(0))
+                self.off -= 2
+                self.branch(condition, a1)
+                next_block = None
+            elif op == LVM.JNL:
+                condition = "M[{}] < {}".format(self.address(a1, a2), self.const(a3))
+                self.branch(condition, a4)
+                next_block = None
+            elif op == LVM.CFU:
+                self.push(pc)
+                self.commit()
+                next_block = self.jump(a1)
+            elif op == LVM.RET:
+                self.commit()
+                self.emit("frame = D[{}] - 1".format(a1))
+                self.emit("result = frame - {}".format(a2 + 2))
+                self.emit("saved, ret_pc = M[frame], M[frame - 1]")
+                self.emit("M[result] = M[sp]")
+                self.emit("D[{}] = saved".format(a1))
+                self.emit("sp = result")
+                self.emit("b = ret_pc + 1")
+                self.emit("continue")
+                next_block = None
+            else:
+                # Instructions that move sp by a runtime amount or touch
+                # the memory backend run the interpreter's own statements
+                self.commit()
+                self.generic(op, a1)
+        self.close_segment()
+        if next_block is not None:
+            self.commit()
+            self.emit("b = {}".format(next_block))
+            self.emit("continue")
+        return self.lines
+
+    def branch(self, condition, target):
+        # The condition is read before sp moves, so it uses the old offsets
+        move = []
+        if self.off:
+            move = ["    sp += {}".format(self.off) if self.off > 0 else "    sp -= {}".format(-self.off)]
+            self.off = 0
+        self.emit("if {}:".format(condition))
+        self.lines += move
+        self.emit("    b = {}".format(self.stop))
+        self.emit("else:")
+        self.lines += move
+        self.emit("    b = {}".format(self.jump(target)))
+        self.emit("continue")
+
+    def generic(self, op, a1):
+        emit = self.emit
+        if op == LVM.LMV:
+            emit("t = M[sp]")
+            emit("M = memory.ensure(max(sp, t) + {})".format(a1))
+            emit("memory.copy(sp, t, {})".format(a1))
+        elif op == LVM.SMV:
+            emit("t = M[sp - {}]".format(a1))
+            emit("M = memory.ensure(t + {})".format(a1))
+            emit("memory.copy(t, sp - {}, {})".format(a1 - 1, a1))
+            emit("sp -= {}".format(a1 + 1))
+        elif op == LVM.SMR:
+            emit("t1 = M[sp - 1]")
+            emit("t2 = M[sp]")
+            emit("M = memory.ensure(max(t1, t2) + {})".format(a1))
+            emit("memory.copy(t1, t2, {})".format(a1))
+            emit("sp -= 1")
+        elif op == LVM.PRT:
+            emit("write(' '.join(str(x) for x in M[sp - {}:sp + 1]) + '\\n')".format(a1 - 1))
+            emit("sp -= {}".format(a1))
+        elif op == LVM.PRV:
+            emit("write(chr(M[sp]) + '\\n')" if a1 else "write(str(M[sp]) + '\\n')")
+            emit("sp -= 1")
+        elif op == LVM.PRC:
+            emit("write(str(H[{}]))".format(a1))
+        elif op == LVM.PRS:
+            emit("adr = M[sp]")
+            emit("chars = [str(M[adr + i]) for i in range(1, M[adr] + 1)]")
+            emit("write(''.join(chars))")
+            emit("sp -= len(chars)")
+        elif op == LVM.RDV:
+            emit("flush()")
+            emit("val = read_value()")
+            emit("M = memory.prepare(sp + 2, [val])")
+            emit("M[sp + 1] = val")
+            emit("sp += 1")
+        elif op in (LVM.RDS, LVM.STS):
+            if op == LVM.RDS:
+                emit("flush()")
+            emit("string = read_string()" if op == LVM.RDS else "string = H[{}]".format(a1))
+            emit("adr = M[sp]")
+            emit("M = memory.prepare(adr + len(string) + 1, string)")
+            emit("M[adr] = len(string)")
+            emit("for c in string:")
+            emit("    adr += 1")
+            emit("    M[adr] = c")
+            emit("sp -= 1")
+        else:
+            raise ValueError("cannot compile opcode {}".format(op))
+        self.shift += {LVM.PRT: -a1, LVM.PRV: -1, LVM.SMV: -a1 - 1, LVM.SMR: -1,
+                       LVM.RDV: 1, LVM.RDS: -1, LVM.STS: -1}.get(op, 0)
+
+
+def dispatch(blocks, leaders, depth):
+    """Nested ifs selecting the block whose id is `b`, by binary search."""
+    indent = "    " * depth
+    lines = []
+    if len(leaders) <= DISPATCH_LEAF_SIZE:
+        for i, leader in enumerate(leaders):
+            lines.append("{}{} b == {}:".format(indent, "if" if i == 0 else "elif", leader))
+            lines += [indent + "    " + line for line in blocks[leader]]
+        return lines
+    middle = len(leaders) // 2
+    lines.append("{}if b < {}:".format(indent, leaders[middle]))
+    lines += dispatch(blocks, leaders[:middle], depth + 1)
+    lines.append("{}else:".format(indent))
+    lines += dispatch(blocks, leaders[middle:], depth + 1)
+    return lines
+
+
+def python_source(bytecode):
+    leaders = block_leaders(bytecode)
+    bounds = leaders[1:] + [len(bytecode)]
+    blocks = {}
+    for start, stop in zip(leaders, bounds):
+        blocks[start] = BlockCompiler(bytecode, start, stop).compile()
+    # Reaching the end of the code stops the program; any other id means a
+    # return into the middle of a block, which the interpreter resumes
+    blocks[len(bytecode)] = ["return b, sp"]
+    lines = [
+        "def program(memory, D, H, consts, output, source, sp, b):",
+        "    M = memory.data",
+        "    write, flush = output.write, output.flush",
+        "    read_value, read_string = source.read_value, source.read_string",
+        "    while True:",
+    ]
+    lines += dispatch(blocks, leaders + [len(bytecode)], 2)
+    lines.append("        return b, sp")
+    return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_source(source):
+    namespace = {}
+    exec(compile(source, "<lvm>", "exec"), namespace)
+    return namespace['program']
+
+
+def compile_bytecode(bytecode):
+    """
+    Returns program(memory, D, H, consts, output, source, sp, b), which
+    runs the bytecode from block `b` until it leaves the compiled code, and
+    returns the pc it stopped at with the final stack pointer. The functions
+    of the last CACHE_SIZE sources are cached, so a program run again
+    compiles once.
+    """
+    return compile_source(python_source(bytecode))
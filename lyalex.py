@@ -1,4 +1,29 @@
+import codecs
 import ply.lex as lex
+from helpers import table_signature, load_table
+
+
+class IncompleteInput(Exception):
+    """A block comment reached the end of a window that more input follows."""
+    def __init__(self, lexpos, lineno):
+        super().__init__(lexpos, lineno)
+        self.lexpos = lexpos
+        self.lineno = lineno
+
+
+def char_constant_value(charval, intval):
+    """Value of a character literal, from the groups matched by t_CCONST."""
+    if intval is not None:
+        return intval
+    if charval == "\\t":
+        return ord('\t')
+    elif charval == '\\n':
+        return ord('\n')
+    elif charval[0] == '\\':
+        return ord(charval[1])
+    else:
+        return ord(charval)
+
 
 class LexerLuthor(object):
     # List of token names.   This is always required
@@ -63,6 +88,9 @@ class LexerLuthor(object):
 
     # A string containing ignored characters (spaces and tabs)
     t_ignore  = ' \t'
+
+    # Set by StreamingLexer while the input it holds is not all there is
+    more_input = False
     #t_CCONST = r'(?:\')(.)(?:\')'
 
 
@@ -84,17 +112,7 @@ class LexerLuthor(object):
     def  t_CCONST(self, t):
       r'\'(?P<charval>.|\\.|\^\((?P<intval>\d+)\))?\''
       match = self.lexer.lexmatch
-      t.value = match.group('intval')
-      if t.value is None:
-        value = match.group('charval')
-        if value == "\\t":
-            t.value = ord('\t')
-        elif value == '\\n':
-            t.value = ord('\n')
-        elif value[0] == '\\':
-            t.value = ord(value[1])
-        else:
-            t.value = ord(value)
+      t.value = char_constant_value(match.group('charval'), match.group('intval'))
       return t
 
     def  t_SCONST(self, t):
@@ -111,6 +129,8 @@ class LexerLuthor(object):
 
     def t_COMMENT_ERROR(self, t):
       r'/\*(.|\n)*'
+      if self.more_input:
+          raise IncompleteInput(t.lexpos, t.lexer.lineno)
       print("%d: Unterminated comment" % t.lexer.lineno)
       t.lexer.skip(len(t.value))
 
@@ -129,11 +149,115 @@ class LexerLuthor(object):
         print("Illegal character '%s'" % t.value[0])
         t.lexer.skip(1)
 
-    # Build the lexer
-    def __init__(self, **kwargs):
+    # Build the lexer. With a table_dir the lexer tables are kept there,
+    # keyed by the rules they came from, and the rules are not revalidated
+    def __init__(self, table_dir=None, **kwargs):
+        if table_dir is not None:
+            name = "lya_lextab_{}".format(table_signature(self, 't_'))
+            kwargs.update(optimize=True, lextab=load_table(table_dir, name), outputdir=table_dir)
         self.lexer = lex.lex(module=self, **kwargs)
 
 
+def iter_chunks(source, chunk_size=1 << 16, encoding='utf-8'):
+    """
+    Text chunks of a str, of a file or memory-mapped file opened in text or
+    binary mode, or of any iterable of str or bytes. Bytes are decoded
+    incrementally, so characters split between chunks are kept whole.
+    """
+    if isinstance(source, (str, bytes)):
+        chunks = [source]
+    elif hasattr(source, 'read'):
+        chunks = iter(lambda: source.read(chunk_size), source.read(0))
+    else:
+        chunks = source
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class StreamingLexer(object):
+    """
+    Runs a LexerLuthor over chunked input without joining it. The PLY
+    lexer is given one window at a time, always cut after a newline, so
+    only block comments can cross a window boundary; when one does, the
+    window is restarted at the comment with enough input to close it.
+    Token positions are offsets into the whole source.
+
+    Pass it to PeterParser.parse as the lexer.
+    """
+    def __init__(self, luthor, source, chunk_size=1 << 16, encoding='utf-8'):
+        self.luthor = luthor
+        self.lexer = luthor.lexer
+        self.chunks = iter_chunks(source, chunk_size, encoding)
+        self.exhausted = False
+        # Input read past the current window
+        self.pending = ''
+        self.window = ''
+        # Position of the window in the whole source
+        self.offset = 0
+        self.lexer.lineno = 1
+        self.next_window()
+
+    @property
+    def lineno(self):
+        return self.lexer.lineno
+
+    def read_until(self, text, marker, start):
+        while not self.exhausted and text.find(marker, start) < 0:
+            start = max(len(text) - len(marker) + 1, start)
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+            else:
+                text += chunk
+        return text
+
+    def next_window(self, keep='', closing=None):
+        """
+        Makes `keep`, the unfinished end of the last window, and the input
+        after it up to a newline the next window. `closing` is a marker the
+        new input must contain before that newline.
+        """
+        text = keep + self.pending
+        start = len(keep)
+        if closing is not None:
+            # A marker may be split between the kept text and the new input
+            text = self.read_until(text, closing, max(start - len(closing) + 1, 0))
+            start = max(text.find(closing, start), start)
+        text = self.read_until(text, '\n', start)
+        cut = len(text) if self.exhausted else text.rfind('\n') + 1
+        self.window, self.pending = text[:cut], text[cut:]
+        self.luthor.more_input = not self.exhausted
+        self.lexer.input(self.window)
+
+    def input(self, data):
+        raise TypeError("StreamingLexer reads its source itself")
+
+    def token(self):
+        while True:
+            try:
+                tok = self.lexer.token()
+            except IncompleteInput as e:
+                self.offset += e.lexpos
+                self.lexer.lineno = e.lineno
+                self.next_window(self.window[e.lexpos:], closing='*/')
+                continue
+            if tok is not None:
+                tok.lexpos += self.offset
+                return tok
+            if self.exhausted:
+                self.luthor.more_input = False
+                return None
+            self.offset += len(self.window)
+            self.next_window()
+
+    def __iter__(self):
+        return iter(self.token, None)
+
+
 if __name__ == '__main__':
     from helpers import get_data
     lexer = LexerLuthor()
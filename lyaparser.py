@@ -1,16 +1,40 @@
 # Yacc example
 
 import ply.yacc as yacc
+from ply.lex import LexToken
 
 # Get the token map from the lexer.  This is required.
 from lyalex import LexerLuthor
 import node
+from errors import UnexpectedToken
+from helpers import table_signature, load_table
+
+
+def builds_node(rule):
+    """Marks a production that builds an AST node, so it is given a span."""
+    rule.builds_node = True
+    return rule
+
+
+def with_span(rule):
+    """
+    Wraps a production so the node it builds records where it was parsed:
+    the lexpos of its first and last tokens, as p.lexspan(0) returns them.
+    """
+    def reduce(p):
+        rule(p)
+        symbol = p.slice[0]
+        # Some alternatives of a rule pass a list or nothing along
+        if isinstance(symbol.value, node.Node):
+            symbol.value.span = (symbol.lexpos, symbol.endlexpos)
+    return reduce
 
 
 # noinspection PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic,PyMethodMayBeStatic
 class PeterParser(object):
     start = 'program'
 
+    @builds_node
     def p_program(self, p):
         """program : statement_list"""
         p[0] = node.Program(p.lexer.lineno, p[1])
@@ -19,7 +43,14 @@ class PeterParser(object):
         """statement_list : statement
                           | statement_list statement
         """
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[2]]
+        if len(p) == 2:
+            p[0] = [p[1]] if p[1] is not None else []
+        else:
+            # Appending in place keeps long lists linear to build;
+            # statements that did not parse are left out
+            if p[2] is not None:
+                p[1].append(p[2])
+            p[0] = p[1]
 
     def p_statement(self, p):
         """statement : declaration_statement
@@ -29,15 +60,21 @@ class PeterParser(object):
                               | action_statement"""
         p[0] = p[1]
 
+    @builds_node
     def p_declaration_statement(self, p):
         """declaration_statement : DCL declaration_list SEMI"""
         p[0] = node.DeclarationStatement(p.lexer.lineno, p[2])
 
     def p_declaration_list(self, p):
         """declaration_list : declaration
-                            | declaration COMMA declaration_list"""
-        p[0] = [p[1]] if len(p) == 2 else [p[1]] + p[3]
+                            | declaration_list COMMA declaration"""
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
+    @builds_node
     def p_declaration(self, p):
         """declaration : identifier_list mode
                        | identifier_list mode initialization"""
@@ -59,16 +96,19 @@ class PeterParser(object):
                          | discrete_range_mode"""
         p[0] = p[1]
 
+    @builds_node
     def p_reference_mode(self, p):
         """reference_mode : REF mode"""
         p[0] = node.ReferenceMode(p.lexer.lineno, p[2])
 
+    @builds_node
     def p_basic_mode(self, p):
         """basic_mode : INT
                       | CHAR
                       | BOOL"""
         p[0] = node.BasicMode(p.lexer.lineno, p[1])
 
+    @builds_node
     def p_discrete_range_mode(self, p):
         """discrete_range_mode : discrete_mode_name LPAREN literal_range RPAREN
                                | discrete_mode LPAREN literal_range RPAREN """
@@ -78,6 +118,7 @@ class PeterParser(object):
         """discrete_mode_name : identifier"""
         p[0] = p[1]
 
+    @builds_node
     def p_literal_range(self, p):
         """literal_range : expression COLON expression"""
         p[0] = node.LiteralRange(p.lexer.lineno, p[1], p[3])
@@ -86,8 +127,13 @@ class PeterParser(object):
         """identifier_list : identifier
                            | identifier_list COMMA identifier """
 
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[3]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
+    @builds_node
     def p_identifier(self, p):
         """identifier : ID"""
         p[0] = node.Identifier(p.lexer.lineno, p[1])
@@ -105,6 +151,7 @@ class PeterParser(object):
                          | call_action"""
         p[0] = p[1]
 
+    @builds_node
     def p_dereferenced_reference(self, p):
         """dereferenced_reference : location ARROW"""
         p[0] = node.DereferenceLocation(p.lexer.lineno, p[1])
@@ -121,6 +168,7 @@ class PeterParser(object):
     #     'string_slice : identifier LBRACKET expression COLON expression RBRACKET'
     #     p[0] = node.Slice(p.lexer.lineno, 'string', p[1], p[3], p[5])
 
+    @builds_node
     def p_array_element(self, p):
         """array_element : location LBRACKET expression_list RBRACKET"""
         p[0] = node.ArrayElement(p.lexer.lineno, p[1], p[3])
@@ -128,8 +176,13 @@ class PeterParser(object):
     def p_expression_list(self, p):
         """expression_list : expression
                           | expression_list COMMA expression"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[3]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
+    @builds_node
     def p_array_slice(self, p):
         """array_slice : location LBRACKET expression COLON expression RBRACKET"""
         p[0] = node.Slice(p.lexer.lineno, 'array', p[1], p[3], p[5])
@@ -141,31 +194,38 @@ class PeterParser(object):
                            | parenthesized_expression"""
         p[0] = p[1]
 
+    @builds_node
     def p_literal_int(self, p):
         """literal : ICONST"""
         p[0] = node.LiteralNode(p.lexer.lineno, p[1], 'int')
 
+    @builds_node
     def p_literal_bool(self, p):
         """literal : TRUE
                    | FALSE"""
         p[0] = node.LiteralNode(p.lexer.lineno, p[1] == 'true', 'bool')
 
+    @builds_node
     def p_literal_char(self, p):
         """literal : CCONST"""
         p[0] = node.LiteralNode(p.lexer.lineno, p[1], 'char')
 
+    @builds_node
     def p_literal_string(self, p):
         """literal : SCONST"""
         p[0] = node.LiteralNode(p.lexer.lineno, p[1], 'string')
 
+    @builds_node
     def p_literal_null(self, p):
         """literal : NULL"""
         p[0] = node.LiteralNode(p.lexer.lineno, p[1], 'null')
 
+    @builds_node
     def p_value_array_element(self, p):
         """value_array_element : primitive_value LBRACKET expression_list RBRACKET"""
         p[0] = node.ArrayElement(p.lexer.lineno, p[1], p[3])
 
+    @builds_node
     def p_value_array_slice(self, p):
         """value_array_slice : primitive_value LBRACKET expression COLON expression RBRACKET"""
         p[0] = node.Slice(p.lexer.lineno, 'value-array', p[1], p[3], p[5])
@@ -179,6 +239,7 @@ class PeterParser(object):
                      | conditional_expression"""
         p[0] = p[1]
 
+    @builds_node
     def p_conditional_expression(self, p):
         """conditional_expression : IF expression THEN expression ELSE expression FI
                                  | IF expression THEN expression elsif_list ELSE expression FI"""
@@ -190,12 +251,18 @@ class PeterParser(object):
     def p_elsif_list(self, p):
         """elsif_list : elsif_expression
                       | elsif_list elsif_expression"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[2]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[2])
+            p[0] = p[1]
 
+    @builds_node
     def p_elsif_expression(self, p):
         """elsif_expression : ELSIF expression THEN expression"""
         p[0] = node.ElsIf(p.lexer.lineno, p[2], p[4])
 
+    @builds_node
     def p_operand0(self, p):
         """operand0 : operand1
                     | operand0 operator1 operand1"""
@@ -209,6 +276,7 @@ class PeterParser(object):
                     | IN"""
         p[0] = p[1]
 
+    @builds_node
     def p_relational_operator(self, p):
         """relational_operator : AND
                                 | OR
@@ -220,6 +288,7 @@ class PeterParser(object):
                                 | DIF"""
         p[0] = node.OperatorNode(p.lexer.lineno, p[1])
 
+    @builds_node
     def p_operand1(self, p):
         """operand1 : operand2
                     | operand1 operator2 operand2"""
@@ -228,12 +297,14 @@ class PeterParser(object):
         else:
             p[0] = node.BinOp(p.lexer.lineno, p[1], p[2], p[3])
 
+    @builds_node
     def p_operator2(self, p):
         """operator2 : PLUS
                     | MINUS
                     | CONCAT"""
         p[0] = node.OperatorNode(p.lexer.lineno, p[1])
 
+    @builds_node
     def p_operand2(self, p):
         """operand2 : operand3
                     | operand2 arithmetic_multiplicative_operator operand3"""
@@ -242,12 +313,14 @@ class PeterParser(object):
         else:
             p[0] = node.BinOp(p.lexer.lineno, p[1], p[2], p[3])
 
+    @builds_node
     def p_arithmetic_multiplicative_operator(self, p):
         """arithmetic_multiplicative_operator : TIMES
                                                 | DIVIDE
                                                 | MODULO"""
         p[0] = node.OperatorNode(p.lexer.lineno, p[1])
 
+    @builds_node
     def p_operand3(self, p):
         """operand3 : operand4
                     | monadic_operator operand4
@@ -257,6 +330,7 @@ class PeterParser(object):
         else:
             p[0] = node.BasicNode(p.lexer.lineno, p[1]) if type(p[1]) == str else p[1]
 
+    @builds_node
     def p_monadic_operator(self, p):
         """monadic_operator : MINUS
                             | EXCL"""
@@ -268,6 +342,7 @@ class PeterParser(object):
                     | primitive_value"""
         p[0] = p[1]
 
+    @builds_node
     def p_referenced_location(self, p):
         """referenced_location : ARROW location"""
         p[0] = node.ReferenceLocation(p.lexer.lineno, p[2])
@@ -277,14 +352,17 @@ class PeterParser(object):
                           | array_mode"""
         p[0] = p[1]
 
+    @builds_node
     def p_string_mode(self, p):
         """string_mode : CHARS LBRACKET string_length RBRACKET"""
         p[0] = node.StringMode(p.lexer.lineno, p[3])
 
+    @builds_node
     def p_string_length(self, p):
         """string_length : ICONST"""
         p[0] = node.LiteralNode(p.lexer.lineno, p[1], 'int')
 
+    @builds_node
     def p_array_mode(self, p):
         """array_mode : ARRAY LBRACKET index_mode_list RBRACKET mode"""
         p[0] = node.ArrayMode(p.lexer.lineno, p[3], p[5])
@@ -292,13 +370,18 @@ class PeterParser(object):
     def p_index_mode_list(self, p):
         """index_mode_list : index_mode
                            | index_mode_list COMMA index_mode"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[3]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
     def p_index_mode(self, p):
         """index_mode : discrete_mode
                       | literal_range"""
         p[0] = p[1]
 
+    @builds_node
     def p_synonym_statement(self, p):
         """synonym_statement : SYN synonym_list SEMI"""
         p[0] = node.SynonymStatement(p.lexer.lineno, p[2])
@@ -306,8 +389,13 @@ class PeterParser(object):
     def p_synonym_list(self, p):
         """synonym_list : synonym_definition
                         | synonym_list COMMA synonym_definition"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[3]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
+    @builds_node
     def p_synonym_definition(self, p):
         """synonym_definition : identifier_list ASSIGN expression
                               | identifier_list mode ASSIGN expression"""
@@ -318,6 +406,7 @@ class PeterParser(object):
             exp = p[4]
         p[0] = node.Synonym(p.lexer.lineno, p[1], exp, mode)
 
+    @builds_node
     def p_newmode_statement(self, p):
         """newmode_statement : TYPE newmode_list SEMI"""
         p[0] = node.NewModeStatement(p.lexer.lineno, p[2])
@@ -325,62 +414,90 @@ class PeterParser(object):
     def p_newmode_list(self, p):
         """newmode_list : mode_definition
                                     | newmode_list COMMA mode_definition"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[3]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
+    @builds_node
     def p_mode_definition(self, p):
         """mode_definition : identifier_list ASSIGN mode"""
         p[0] = node.ModeDefinition(p.lexer.lineno, p[1], p[3])
 
+    @builds_node
     def p_procedure_statement(self, p):
         """procedure_statement : label_id COLON procedure_definition SEMI"""
-        p[0] = node.ProcedureStatement(p.lexer.lineno, p[1], p[3])
+        if p[3] is not None:
+            p[0] = node.ProcedureStatement(p.lexer.lineno, p[1], p[3])
 
+    @builds_node
     def p_procedure_definition_empty(self, p):
         """procedure_definition : PROC LPAREN RPAREN SEMI END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno)
 
+    @builds_node
     def p_procedure_definition_statement_only(self, p):
         """procedure_definition : PROC LPAREN RPAREN SEMI statement_list END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, statement_list=p[5])
 
+    @builds_node
     def p_procedure_definition_result_only(self, p):
         """procedure_definition : PROC LPAREN RPAREN result_spec SEMI END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, result_spec=p[4])
 
+    @builds_node
     def p_procedure_definition_parameter_only(self, p):
         """procedure_definition : PROC LPAREN formal_parameter_list RPAREN SEMI END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, formal_parameter_list=p[3])
 
+    @builds_node
     def p_procedure_definition_result_statement(self, p):
         """procedure_definition : PROC LPAREN RPAREN result_spec SEMI statement_list END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, result_spec=p[4], statement_list=p[6])
 
+    @builds_node
     def p_procedure_definition_parameter_statement(self, p):
         """procedure_definition : PROC LPAREN formal_parameter_list RPAREN SEMI statement_list END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, formal_parameter_list=p[3], statement_list=p[6])
 
+    @builds_node
     def p_procedure_definition_parameter_result(self, p):
         """procedure_definition : PROC LPAREN formal_parameter_list RPAREN result_spec SEMI END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, formal_parameter_list=p[3], result_spec=p[5])
 
+    @builds_node
     def p_procedure_definition_all(self, p):
         """procedure_definition : PROC LPAREN formal_parameter_list RPAREN result_spec SEMI statement_list END"""
         p[0] = node.ProcedureDefinition(p.lexer.lineno, formal_parameter_list=p[3], result_spec=p[5],
                                         statement_list=p[7])
 
+    def p_procedure_definition_error(self, p):
+        """procedure_definition : PROC error END"""
+        # A heading that did not parse: the procedure is left out
+        self.parser.errok()
+        p[0] = None
+
     def p_formal_parameter_list(self, p):
         """formal_parameter_list : formal_parameter
                                                   | formal_parameter_list COMMA formal_parameter"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[3]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[3])
+            p[0] = p[1]
 
+    @builds_node
     def p_formal_parameter(self, p):
         """formal_parameter : identifier_list parameter_spec"""
         p[0] = node.FormalParameter(p.lexer.lineno, p[1], p[2])
 
+    @builds_node
     def p_attribute(self, p):
         """attribute : LOC"""
         p[0] = node.LocNode(p.lexer.lineno)
 
+    @builds_node
     def p_parameter_spec(self, p):
         """parameter_spec : mode
                          | mode attribute"""
@@ -389,6 +506,7 @@ class PeterParser(object):
             parameter_attrib = p[2]
         p[0] = node.Spec(p.lexer.lineno, spec_type='parameter', mode=p[1], attribute=parameter_attrib)
 
+    @builds_node
     def p_result_spec(self, p):
         """result_spec : RETURNS LPAREN mode RPAREN
                         | RETURNS LPAREN mode attribute RPAREN"""
@@ -397,16 +515,29 @@ class PeterParser(object):
             result_attrib = p[4]
         p[0] = node.Spec(p.lexer.lineno, spec_type='result', mode=p[3], attribute=result_attrib)
 
+    @builds_node
     def p_action_statement(self, p):
         """action_statement : action SEMI
                             | label_id COLON action SEMI"""
         action, label_id = (p[1], None) if len(p) == 3 else (p[3], p[1])
         p[0] = node.ActionStatement(p.lexer.lineno, action, label_id)
 
+    def p_action_statement_error(self, p):
+        """action_statement : error SEMI"""
+        # Skips to the end of a statement that did not parse and leaves it
+        # out; errors in the statements after it are reported again
+        self.parser.errok()
+        p[0] = None
+
     def p_action_statement_list(self, p):
         """action_statement_list : action_statement
                                  | action_statement_list action_statement"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[2]]
+        if len(p) == 2:
+            p[0] = [p[1]] if p[1] is not None else []
+        else:
+            if p[2] is not None:
+                p[1].append(p[2])
+            p[0] = p[1]
 
     def p_action(self, p):
         """action : bracketed_action
@@ -422,10 +553,12 @@ class PeterParser(object):
                             | do_action"""
         p[0] = p[1]
 
+    @builds_node
     def p_assignment_action(self, p):
         """assignment_action : location assigning_operator expression"""
         p[0] = node.AssignmentAction(p.lexer.lineno, p[1], p[2], p[3])
 
+    @builds_node
     def p_assigning_operator(self, p):
         """assigning_operator : ASSIGN
                              | closed_dyadic_operator ASSIGN"""
@@ -441,23 +574,28 @@ class PeterParser(object):
                                     | CONCAT"""
         p[0] = p[1]
 
+    @builds_node
     def p_if_action_elsif(self, p):
         """if_action : IF expression then_clause FI
                      | IF expression then_clause elsif_clause FI
                      | IF expression then_clause elsif_clause else_clause FI"""
         p[0] = node.IfAction(p.lexer.lineno, *p[2:len(p) - 1])
 
+    @builds_node
     def p_if_action_else(self, p):
         """if_action : IF expression then_clause else_clause FI"""
         p[0] = node.IfAction(p.lexer.lineno, expression=p[2], then_clause=p[3],
                              else_clause=p[4])
 
+    @builds_node
     def p_then_clause(self, p):
         """then_clause : THEN
                        | THEN action_statement_list"""
-        p[0] = node.StatementBlock(p[2]) if len(p) > 2 else None
+        # An empty block still gives the condition a branch to skip
+        p[0] = node.StatementBlock(p[2] if len(p) > 2 else [])
         # p[0] = p[2] if len(p) > 2 else None
 
+    @builds_node
     def p_else_clause(self, p):
         """else_clause : ELSE
                        | ELSE action_statement_list"""
@@ -472,12 +610,18 @@ class PeterParser(object):
     def p_elsif_clause_list(self, p):
         """elsif_clause_list : elsif_clause_exp
                              | elsif_clause_list elsif_clause_exp"""
-        p[0] = [p[1]] if len(p) == 2 else p[1] + [p[2]]
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[2])
+            p[0] = p[1]
 
+    @builds_node
     def p_elsif_clause_exp(self, p):
         """elsif_clause_exp : ELSIF expression then_clause"""
         p[0] = node.ConditionalBlock(p.lexer.lineno, *p[2:])
 
+    @builds_node
     def p_do_action(self, p):
         """do_action : DO OD
                     | DO control_part SEMI OD
@@ -492,11 +636,13 @@ class PeterParser(object):
             ctrl_part, action_list = p[2], p[4]
         p[0] = node.DoAction(p.lexer.lineno, ctrl_part, action_list)
 
+    @builds_node
     def p_control_part_for(self, p):
         """control_part : for_control
                         | for_control while_control"""
         p[0] = node.ControlPart(p.lexer.lineno, *p[1:])
 
+    @builds_node
     def p_control_part_while(self, p):
         """control_part      : while_control"""
         p[0] = node.ControlPart(p.lexer.lineno, while_ctrl=p[1])
@@ -510,6 +656,7 @@ class PeterParser(object):
                     | range_enumeration"""
         p[0] = p[1]
 
+    @builds_node
     def p_step_enumeration_up(self, p):
         """step_enumeration : identifier ASSIGN expression TO expression
                              | identifier ASSIGN expression step_value TO expression"""
@@ -519,6 +666,7 @@ class PeterParser(object):
         step_val = p[4] if len(p) > 6 else None
         p[0] = node.StepEnumeration(p.lexer.lineno, True, identifier, from_exp, to_exp, step_val)
 
+    @builds_node
     def p_step_enumeration_down(self, p):
         """step_enumeration : identifier ASSIGN expression DOWN TO expression
                              | identifier ASSIGN expression step_value DOWN TO expression"""
@@ -532,6 +680,7 @@ class PeterParser(object):
         """step_value : BY expression"""
         p[0] = p[2]
 
+    @builds_node
     def p_range_enumeration(self, p):
         """range_enumeration : identifier IN discrete_mode
                             | identifier DOWN IN discrete_mode"""
@@ -547,32 +696,38 @@ class PeterParser(object):
                         | builtin_call"""
         p[0] = p[1]
 
+    @builds_node
     def p_procedure_call(self, p):
         """procedure_call : identifier LPAREN RPAREN
                          | identifier LPAREN expression_list RPAREN"""
         exp_list = p[3] if len(p) > 4 else None
         p[0] = node.ProcedureCall(p.lexer.lineno, p[1], exp_list)
 
+    @builds_node
     def p_exit_action(self, p):
         """exit_action : EXIT identifier"""
         p[0] = node.PassNode(p.lexer.lineno, 'EXIT', p[2])
 
+    @builds_node
     def p_return_action(self, p):
         """return_action : RETURN
                         | RETURN expression"""
         exp = p[2] if len(p) > 2 else None
         p[0] = node.ReturnAction(p.lexer.lineno, exp)
 
+    @builds_node
     def p_result_action(self, p):
         """result_action : RESULT expression"""
         p[0] = node.PassNode(p.lexer.lineno, 'RESULT', p[2])
 
+    @builds_node
     def p_builtin_call(self, p):
         """builtin_call : builtin_name LPAREN RPAREN
                         | builtin_name LPAREN expression_list RPAREN"""
         exp_list = p[3] if len(p) > 4 else None
         p[0] = node.BuiltinCall(p.lexer.lineno, p[1], exp_list)
 
+    @builds_node
     def p_builtin_name(self, p):
         """builtin_name : ABS
                         | ASC
@@ -594,18 +749,152 @@ class PeterParser(object):
 
     # Error rule for syntax errors
     def p_error(self, p):
-        if p is not None:
-            print("ERROR (syntax) on line %s" % (p.lexer.lineno))
-        else:
-            print("Unexpected end of input")
+        if p is not None and p.type == 'error':
+            # Put in by end_of_input, the parser pops back to a rule that
+            # takes it
+            return
+        if p is None or getattr(p, 'inserted', False):
+            return self.end_of_input()
+        self.report(UnexpectedToken(p.type, p.value, p.lineno, p.lexpos))
+
+    def report(self, issue):
+        self.syntax_errors.append(issue)
+        print("ERROR (syntax) on line {}: {}".format(issue.line_number, issue.message()))
+
+    # Tokens put in at the end of input to close what is still open, in
+    # order of preference
+    CLOSERS = (('SEMI', ';'), ('END', 'end'), ('OD', 'od'), ('FI', 'fi'), ('RPAREN', ')'), ('RBRACKET', ']'))
+    # Tokens put in by a parse at most, in case closing never ends
+    MAX_INSERTED = 100
+
+    def insert(self, type, value):
+        tok = LexToken()
+        tok.type = type
+        tok.value = value
+        tok.lineno = self.lexer_in_use.lineno
+        # Spans of what it closes end at the last token read
+        tok.lexpos = self.last_lexpos
+        tok.inserted = True
+        self.inserted += 1
+        return tok
+
+    def report_truncated(self):
+        # Reported at the last token read, as the end of input may be past
+        # the last line
+        if not self.truncated:
+            self.truncated = True
+            self.report(UnexpectedToken(None, None, self.last_lineno, self.last_lexpos))
+
+    def end_of_input(self):
+        """
+        Called when the input ends where the parser can neither stop nor
+        take a closer: an error token is put in, so the parser drops what
+        it holds back to the innermost statement that error SEMI can end.
+        """
+        self.report_truncated()
+        if self.inserted < self.MAX_INSERTED:
+            self.parser.errok()
+            return self.insert('error', None)
 
-    def __init__(self, **kwargs):
-        self.lexer = LexerLuthor(debug=False)
+    def next_token(self):
+        """
+        The lexer's next token. At the end of input, the first of CLOSERS
+        the parser takes is put in while the program is still open, so a
+        truncated program still ends in a Program. error SEMI cannot do it:
+        there is no SEMI left to resync on, and PLY gives up on an error at
+        the end of input by returning nothing, so the statements parsed
+        before it would be lost too.
+        """
+        tok = self.lexer_in_use.token()
+        if tok is not None:
+            self.last_lineno = tok.lineno
+            self.last_lexpos = tok.lexpos
+            return tok
+        if self.inserted >= self.MAX_INSERTED:
+            return None
+        if self.takes('$end'):
+            return None
+        for type, value in self.CLOSERS:
+            if self.takes(type):
+                # Unless the parser is skipping a statement that already
+                # had an error, the program ended too early
+                if self.parser.symstack[-1].type != 'error':
+                    self.report_truncated()
+                return self.insert(type, value)
+        return None
+
+    def takes(self, type):
+        """
+        Whether the parser can shift a `type` token, or accept for '$end',
+        after the reductions it leads to. The action table alone does not
+        tell: LALR states shared by several rules reduce on tokens that
+        only some of them take.
+        """
+        parser = self.parser
+        states = list(parser.statestack)
+        while True:
+            action = parser.action[states[-1]].get(type)
+            if action is None:
+                return False
+            if action >= 0:
+                return True
+            production = parser.productions[-action]
+            if production.len:
+                del states[-production.len:]
+            states.append(parser.goto[states[-1]][production.name])
+
+    def __init__(self, table_dir=None, **kwargs):
+        """
+        With a table_dir, the lexer and parser tables are loaded from it and
+        only rebuilt when the grammar changes, without writing parser.out.
+        """
+        self.lexer = LexerLuthor(debug=False, table_dir=table_dir)
         self.tokens = self.lexer.tokens
-        self.parser = yacc.yacc(module=self, debug=True)
-
-    def parse(self, data):
-        return self.parser.parse(data, self.lexer.lexer)
+        # UnexpectedTokens of the last parse
+        self.syntax_errors = []
+        # Where the input ended up to now, for closing it at its end
+        self.lexer_in_use = None
+        self.last_lineno = 1
+        self.last_lexpos = 0
+        self.inserted = 0
+        self.truncated = False
+        if table_dir is None:
+            self.parser = yacc.yacc(module=self, debug=True)
+        else:
+            name = "lya_parsetab_{}".format(table_signature(self, 'p_'))
+            self.parser = yacc.yacc(module=self, debug=False, optimize=True,
+                                    tabmodule=load_table(table_dir, name), outputdir=table_dir)
+        # Rules that only pass values along or build lists are left alone,
+        # so most reductions pay nothing for spans
+        for production in self.parser.productions:
+            rule = production.callable
+            if getattr(rule, 'builds_node', False):
+                production.callable = with_span(rule)
+
+    def parse(self, data=None, lexer=None):
+        """
+        Parses `data`, or whatever `lexer` reads by itself when data is None,
+        like a StreamingLexer. Positions are tracked so every node gets its
+        span; they are only turned into columns when an error is printed.
+
+        Syntax errors do not stop the parse: the statement or procedure
+        heading they are in is skipped up to its SEMI or END and left out,
+        and every error is kept in syntax_errors. The Program returned then
+        holds the statements that parsed.
+        """
+        if lexer is None:
+            lexer = self.lexer.lexer
+        self.syntax_errors = []
+        self.lexer_in_use = lexer
+        self.last_lineno = lexer.lineno
+        self.last_lexpos = 0
+        self.inserted = 0
+        self.truncated = False
+        AST = self.parser.parse(data, lexer, tracking=True, tokenfunc=self.next_token)
+        if AST is None and self.syntax_errors:
+            # Nothing before the end of input parsed
+            AST = node.Program(lexer.lineno, [])
+        return AST
 
 
 if __name__ == '__main__':
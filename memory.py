@@ -0,0 +1,131 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Memory:
+    """
+    Storage behind LVM.M. The LVM indexes `data` directly, so every method
+    that may replace it returns the new object.
+    """
+    typed = False
+    # Growth stops here, in cells
+    max_size = 1 << 26
+
+    def __init__(self, size=10000):
+        self.data = self.allocate(size)
+
+    def allocate(self, size):
+        return [None] * size
+
+    def extend(self, count):
+        self.data.extend(self.allocate(count))
+
+    def __len__(self):
+        return len(self.data)
+
+    def ensure(self, size):
+        """Grows the memory, at least doubling it, so it holds `size` cells."""
+        if size > len(self.data):
+            if size > self.max_size:
+                raise MemoryError("LVM memory limit of {} cells exceeded".format(self.max_size))
+            self.extend(min(max(size, 2 * len(self.data)), self.max_size) - len(self.data))
+        return self.data
+
+    def storable(self, value):
+        return True
+
+    def widen(self):
+        """Switches to boxed storage so values of any type can be stored."""
+        self.data = self.values(0, len(self.data))
+        self.typed = False
+        return self.data
+
+    def prepare(self, size, values=()):
+        """Makes room for `size` cells and for storing every one of `values`."""
+        if self.typed and not all(self.storable(v) for v in values):
+            self.widen()
+        return self.ensure(size)
+
+    def copy(self, dst, src, count):
+        """Copies `count` cells starting at `src` to `dst`; ranges may overlap."""
+        self.data[dst:dst + count] = self.data[src:src + count]
+
+    def values(self, start, stop):
+        return list(self.data[start:stop])
+
+
+class ListMemory(Memory):
+    pass
+
+
+class ArrayMemory(Memory):
+    """
+    Compact int64 cells. Storing anything that does not fit an int64, like
+    the strings pushed for print or a boolean, widens the memory to a list.
+    Cells never written hold UNSET, which values() reads back as None, as
+    a list memory would.
+    """
+    typed = True
+    # The lowest int64 stands for a cell that was never written
+    UNSET = -(1 << 63)
+
+    def allocate(self, size):
+        if not self.typed:
+            return Memory.allocate(self, size)
+        return array('q', [self.UNSET]) * size
+
+    def storable(self, value):
+        return type(value) is int and self.UNSET < value < (1 << 63)
+
+    def copy(self, dst, src, count):
+        if not self.typed:
+            return super().copy(dst, src, count)
+        # A memoryview moves the raw bytes with a memmove, which handles
+        # overlapping ranges without a temporary array; it is released
+        # right away so the array can still grow
+        with memoryview(self.data) as cells:
+            cells[dst:dst + count] = cells[src:src + count]
+
+    def values(self, start, stop):
+        if not self.typed:
+            return Memory.values(self, start, stop)
+        unset = self.UNSET
+        return [None if value == unset else value for value in self.data[start:stop]]
+
+
+class NumpyMemory(ArrayMemory):
+    def allocate(self, size):
+        if not self.typed:
+            return Memory.allocate(self, size)
+        return numpy.full(size, self.UNSET, dtype=numpy.int64)
+
+    def extend(self, count):
+        if not self.typed:
+            return Memory.extend(self, count)
+        self.data = numpy.concatenate((self.data, self.allocate(count)))
+
+    def copy(self, dst, src, count):
+        if not self.typed:
+            return Memory.copy(self, dst, src, count)
+        # numpy copies the source to a temporary first when the ranges
+        # overlap, as they often do for lmv and smv
+        self.data[dst:dst + count] = self.data[src:src + count]
+
+    def values(self, start, stop):
+        if not self.typed:
+            return Memory.values(self, start, stop)
+        unset = self.UNSET
+        return [None if value == unset else value for value in self.data[start:stop].tolist()]
+
+
+MEMORY_BACKENDS = {
+    'list': ListMemory,
+    'array': ArrayMemory,
+}
+# Only offered when numpy is installed
+if numpy is not None:
+    MEMORY_BACKENDS['numpy'] = NumpyMemory
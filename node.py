@@ -2,30 +2,65 @@ from environments import *
 import errors
 from typing import List
 import LVM
+import visitors
 
 op_to_instr = {
-    '+': [LVM.AddOperator()],
-    '-': [LVM.SubOperator()],
-    '*': [LVM.MulOperator()],
-    '/': [LVM.DivOperator()],
-    '%': [LVM.ModOperator()],
-    '&&': [LVM.LogicalAndOperator()],
-    '||': [LVM.LogicalOrOperator()],
-    '<': [LVM.LessOperator()],
-    '<=': [LVM.LessOrEqualOperator()],
-    '==': [LVM.EqualOperator()],
-    '>=': [LVM.GreaterOrEqualOperator()],
-    '>': [LVM.GreaterOperator()],
-    '!=': [LVM.NotEqualOperator()]
+    '+': LVM.AddOperator,
+    '-': LVM.SubOperator,
+    '*': LVM.MulOperator,
+    '/': LVM.DivOperator,
+    '%': LVM.ModOperator,
+    '&&': LVM.LogicalAndOperator,
+    '||': LVM.LogicalOrOperator,
+    '<': LVM.LessOperator,
+    '<=': LVM.LessOrEqualOperator,
+    '==': LVM.EqualOperator,
+    '>=': LVM.GreaterOrEqualOperator,
+    '>': LVM.GreaterOperator,
+    '!=': LVM.NotEqualOperator
 }
 
 
+# Slots the memoized properties keep their values in. Only the classes with
+# such a property declare them, so other nodes do not pay for the room
+MEMOIZED_SLOTS = ('_children', '_expr_type')
+
+
+def memoized(slot, once_valid=True):
+    """
+    Property whose value is kept in `slot`, so it is only computed again
+    after invalidate(). Types depend on symbols and are only kept once the
+    node is validated; with once_valid False, as for the children, which
+    are fixed when the node is parsed, the first value is kept.
+    """
+    def decorator(compute):
+        def get(self):
+            value = getattr(self, slot, None)
+            if value is None:
+                value = compute(self)
+                if not once_valid or self.__is_valid__ is not None:
+                    setattr(self, slot, value)
+            return value
+        return property(get, doc=compute.__doc__)
+    return decorator
+
+
 class Node(object):
+    # Nodes keep their fields in slots, not in a __dict__, as big programs
+    # have hundreds of thousands of them. Every subclass declares the
+    # fields it sets, and the name shared by all its nodes as display_name
+    __slots__ = ('line_number', 'span', '__is_valid__', '_issues')
+    display_name = ''
+    # Whether validating the children happens in a scope of their own
+    opens_scope = False
+
     def __init__(self, line_number):
-        self.display_name = ''
-        self.issues = []
         self.line_number = line_number
+        # Offsets of the first and last tokens, set by the parser
+        self.span = None
         self.__is_valid__ = None
+        # Most nodes never get an issue, the list is made by add_issue
+        self._issues = None
 
     def __str__(self):
         return self.display_name
@@ -41,6 +76,25 @@ class Node(object):
     def labels(self):
         return None
 
+    @property
+    def issues(self):
+        return self._issues or ()
+
+    def add_issue(self, issue):
+        if self._issues is None:
+            self._issues = []
+        self._issues.append(issue)
+
+    @property
+    def usage(self):
+        return None
+
+    @usage.setter
+    def usage(self, usage):
+        # Only Identifier and ArrayElement load differently by usage and
+        # keep it; other locations and read() arguments ignore it
+        pass
+
     @property
     def expr_type(self) -> ExprType:
         return void_symbol.expr_type
@@ -54,29 +108,66 @@ class Node(object):
         return 1
 
     def validation_visitor(self) -> bool:
-        self.issues = []
+        """Validates the subtree, see visitors.ValidationVisitor."""
+        if self.__is_valid__ is not None:
+            # Validated before, what was kept may not hold anymore
+            self.invalidate()
+        visitors.ValidationVisitor().walk(self)
+        return self.__is_valid__
 
-        for c in self.children:
-            c.validation_visitor()
+    def invalidate(self):
+        """
+        Forgets the validation of the subtree and the children and types the
+        memoized properties kept, as an edit that changes the fields of a
+        node or the symbols it refers to must do before it is used again.
+        """
+        visitors.InvalidationVisitor().walk(self)
 
+    def forget_validation(self):
+        self.__is_valid__ = None
+        for slot in MEMOIZED_SLOTS:
+            if hasattr(self, slot):
+                delattr(self, slot)
+
+    def enter_validation(self):
+        # Runs before the children are validated
+        self._issues = None
+
+    def leave_validation(self):
+        # Runs after the children are validated
         self.__is_valid__ = self.__validate_node__()
         if not self.__is_valid__:
-            return False
+            return
 
         for c in self.children:
             if not c.is_valid:
                 self.__is_valid__ = False
-                return False
+                return
 
-        return self.__is_valid__
+    def enter_scope(self):
+        # Runs once the scope of a node with opens_scope is pushed
+        pass
+
+    def leave_scope(self):
+        # Runs before the scope of a node with opens_scope is popped
+        pass
 
     def __validate_node__(self):
         return True
 
     def lvm_visitor(self):
-        pre_ops = self.lvm_operators_pre()
-        children_ops = [c.lvm_visitor() for c in self.children]
-        return pre_ops + [item for sublist in children_ops for item in sublist] + self.lvm_operators_pos()
+        """The LVM code of the subtree, see visitors.CodeGenerator."""
+        generator = visitors.CodeGenerator()
+        generator.walk(self)
+        return generator.code
+
+    def lvm_parts(self):
+        """
+        The code of the node in order: lists of operators, nodes whose code
+        goes in their place, and methods returning operators, called once
+        everything before them is generated.
+        """
+        return [self.lvm_operators_pre(), *self.children, self.lvm_operators_pos]
 
     def lvm_operators_pos(self) -> List[LVM.LVMOperator]:
         # Operators added before recursive step
@@ -86,17 +177,33 @@ class Node(object):
         # Operators added after recursive step
         return []
 
+    @property
+    def position(self):
+        """
+        (line, column) where the node starts. Without a span or an indexed
+        source only the line the parser was on is known, and column is None.
+        """
+        if self.span is None or cur_context.lines is None:
+            return self.line_number, None
+        return cur_context.lines.position(self.span[0])
+
     def print_error(self):
+        if not self.issues:
+            return
+        line, column = self.position
+        where = line if column is None else "{}:{}".format(line, column)
         for issue in self.issues:
             print("{} line {} {}: {}".format(
                 issue.issue_type.name,
-                self.line_number,
+                where,
                 self.display_name,
                 issue.message()
             ))
 
 
 class PassNode(Node):
+    __slots__ = ('display_name', 'child')
+
     def __init__(self, line_number, node_type, child):
         super().__init__(line_number)
         self.display_name = node_type
@@ -108,6 +215,8 @@ class PassNode(Node):
 
 
 class ListNode(Node):
+    __slots__ = ('display_name', 'child_list')
+
     def __init__(self, child_list, node_type='list'):
         super().__init__(None)
         self.display_name = node_type
@@ -126,6 +235,8 @@ class ListNode(Node):
 
 
 class StatementBlock(ListNode):
+    __slots__ = ('end_jmp_label',)
+
     def __init__(self, child_list):
         super().__init__(child_list, 'block')
         self.end_jmp_label = None
@@ -138,6 +249,8 @@ class StatementBlock(ListNode):
 
 
 class OperatorNode(Node):
+    __slots__ = ('symbol',)
+
     def __init__(self, line_number, symbol: str):
         super().__init__(line_number)
         self.symbol = symbol
@@ -147,6 +260,8 @@ class OperatorNode(Node):
 
 
 class BasicNode(Node):
+    __slots__ = ('value',)
+
     def __init__(self, line_number, value):
         super().__init__(line_number)
         self.value = value
@@ -156,19 +271,23 @@ class BasicNode(Node):
 
 
 class LocNode(Node):
+    __slots__ = ()
+
     def __str__(self):
         return "LOC"
 
 
 class BasicMode(Node):
+    __slots__ = ('node_type', '_expr_type')
+
     def __init__(self, line_number, node_type: str):
         super().__init__(line_number)
-        self.node_type = node_type
+        self.node_type = symbol_key(node_type)
 
     def __str__(self):
         return str(self.expr_type)
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         return cur_context.symbol_env.lookup(self.node_type).expr_type
 
@@ -186,10 +305,13 @@ class IdentifierUsage(Enum):
 
 
 class Identifier(Node):
+    __slots__ = ('name', 'key', 'usage', 'symbol')
+    display_name = 'identifier'
+
     def __init__(self, line_number, name: str):
         super().__init__(line_number)
-        self.display_name = 'identifier'
         self.name = name
+        self.key = symbol_key(name)
         self.usage = IdentifierUsage.VALUE_USAGE
         self.symbol = None
 
@@ -201,12 +323,12 @@ class Identifier(Node):
         return self.symbol.expr_type if self.symbol else void_symbol.expr_type
 
     def __validate_node__(self):
-        self.issues = []
+        self._issues = None
         if self.usage == IdentifierUsage.DECLARATION:
             return True
-        self.symbol = cur_context.symbol_env.lookup(self.name)
+        self.symbol = cur_context.symbol_env.lookup(self.key)
         if self.symbol is None:
-            self.issues.append(errors.UndeclaredVariable(self.name))
+            self.add_issue(errors.UndeclaredVariable(self.name))
             return False
         return True
 
@@ -235,13 +357,15 @@ class Identifier(Node):
             if dyadic_op:
                 op_list = [
                     LVM.LoadReferenceValueOperator(symbol.display_level, symbol.offset),
-                ] + op_to_instr[dyadic_op]
+                    op_to_instr[dyadic_op](),
+                ]
             op_list.append(LVM.StoreReferenceValueOperator(symbol.display_level, symbol.offset))
         else:
             if dyadic_op:
                 op_list = [
                     LVM.LoadValueOperator(symbol.display_level, symbol.offset),
-                ] + op_to_instr[dyadic_op]
+                    op_to_instr[dyadic_op](),
+                ]
             op_list.append(LVM.StoreValueOperator(symbol.display_level, symbol.offset))
         return op_list
 
@@ -250,17 +374,19 @@ class Identifier(Node):
 
 
 class LiteralNode(Node):
+    __slots__ = ('value', 'type_name', '_expr_type')
+
     def __init__(self, line_number, value, type_name: str):
         super().__init__(line_number)
         self.value = value
-        self.type_name = type_name
+        self.type_name = symbol_key(type_name)
 
     def __str__(self):
         if self.expr_type.type == 'char':
             return chr(int(self.value))
         return str(self.value)
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         return cur_context.symbol_env.lookup(self.type_name).expr_type
 
@@ -269,9 +395,11 @@ class LiteralNode(Node):
 
 
 class Spec(Node):
+    __slots__ = ('spec_type', 'mode_node', 'attribute', '_expr_type')
+    display_name = 'spec'
+
     def __init__(self, line_number, spec_type, mode: Node, attribute=None):
         super().__init__(line_number)
-        self.display_name = 'spec'
         self.spec_type = spec_type
         self.mode_node = mode
         self.attribute = attribute
@@ -286,7 +414,7 @@ class Spec(Node):
     def __str__(self):
         return "{0}-{1}".format(self.display_name, self.spec_type)
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return self.mode_node.expr_type
 
@@ -296,9 +424,11 @@ class Spec(Node):
 
 
 class Program(Node):
+    __slots__ = ('statement_list',)
+    display_name = 'program'
+
     def __init__(self, line_number, statement_list):
         super().__init__(line_number)
-        self.display_name = 'program'
         self.statement_list = statement_list
 
     @property
@@ -313,6 +443,8 @@ class Program(Node):
 
 
 class IdentifierInitialization(Node):
+    __slots__ = ('identifier_list', 'mode_node', 'initialization', '_children')
+
     def __init__(self, line_number, identifier_list: list, mode: Node = None, initialization: Node = None):
         super().__init__(line_number)
         self.identifier_list = identifier_list
@@ -321,7 +453,7 @@ class IdentifierInitialization(Node):
         for id_node in self.identifier_list:
             id_node.usage = IdentifierUsage.DECLARATION
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = list()
         c.append(ListNode(self.identifier_list, 'identifiers'))
@@ -352,7 +484,7 @@ class IdentifierInitialization(Node):
             return valid_identifiers
         valid = self.mode_node.expr_type == self.initialization.expr_type
         if not valid:
-            self.issues.append(
+            self.add_issue(
                 errors.TypeMismatch(self.mode_node.expr_type, self.initialization.expr_type)
             )
 
@@ -360,9 +492,11 @@ class IdentifierInitialization(Node):
 
 
 class DeclarationStatement(Node):
+    __slots__ = ('declaration_list',)
+    display_name = 'dcl-stat'
+
     def __init__(self, line_number, declaration_list):
         super().__init__(line_number)
-        self.display_name = 'dcl-stat'
         self.declaration_list = declaration_list
 
     @property
@@ -371,9 +505,11 @@ class DeclarationStatement(Node):
 
 
 class Declaration(IdentifierInitialization):
+    __slots__ = ()
+    display_name = 'dcl'
+
     def __init__(self, line_number, identifier_list, mode: Node, initialization: Node=None):
         super().__init__(line_number, identifier_list, mode=mode, initialization=initialization)
-        self.display_name = 'dcl'
 
     def lvm_operators_pre(self):
         return [LVM.AllocateOperator(len(self.identifier_list)*self.mode_node.lvm_size)]
@@ -388,9 +524,11 @@ class Declaration(IdentifierInitialization):
 
 
 class SynonymStatement(Node):
+    __slots__ = ('synonym_list',)
+    display_name = 'synonym-stat'
+
     def __init__(self, line_number, synonym_list: list):
         super().__init__(line_number)
-        self.display_name = 'synonym-stat'
         self.synonym_list = synonym_list
 
     @property
@@ -399,14 +537,16 @@ class SynonymStatement(Node):
 
 
 class Synonym(IdentifierInitialization):
+    __slots__ = ()
+    display_name = 'synonym'
+
     valid_types = ['int', 'string', 'char', 'bool']
 
     def __init__(self, line_number, identifier_list, expression: Node, mode: Node=None):
         super().__init__(line_number, identifier_list, mode=mode, initialization=expression)
-        self.display_name = 'synonym'
 
     def __validate_node__(self):
-        self.issues = []
+        self._issues = None
 
         valid = super().__validate_node__()
 
@@ -414,7 +554,7 @@ class Synonym(IdentifierInitialization):
             return False
 
         if self.initialization.expr_type.type not in self.valid_types:
-            self.issues.append(
+            self.add_issue(
                 errors.InvalidType(self.initialization.expr_type)
             )
             return False
@@ -423,19 +563,21 @@ class Synonym(IdentifierInitialization):
 
 
 class UnOp(Node):
-    valid_operators = CaseInsensitiveDict({
+    __slots__ = ('operator', 'operand', '_expr_type')
+    display_name = 'un-op'
+
+    valid_operators = {
         'bool': ['!'],
         'int': ['-']
-    })
+    }
 
     op_to_instr = {
-        '!': [LVM.NotOperator()],
-        '-': [LVM.NegateOperator()]
+        '!': LVM.NotOperator,
+        '-': LVM.NegateOperator
     }
 
     def __init__(self, line_number, operator: OperatorNode, operand: Node):
         super().__init__(line_number)
-        self.display_name = 'un-op'
         self.operator = operator
         self.operand = operand
 
@@ -443,35 +585,37 @@ class UnOp(Node):
     def children(self):
         return [self.operator, self.operand]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         return self.operand.expr_type
 
     def __validate_node__(self):
-        self.issues = []
+        self._issues = None
         valid = self.operator.symbol in self.valid_operators.get(self.operand.expr_type.type, [])
         if not valid:
-            self.issues.append(
+            self.add_issue(
                 errors.InvalidOperator(self.operator.symbol, self.operand.expr_type)
             )
         return valid
 
     def lvm_operators_pos(self):
-        return self.op_to_instr[self.operator.symbol]
+        return [self.op_to_instr[self.operator.symbol]()]
 
 
 class BinOp(Node):
-    valid_operators = CaseInsensitiveDict({
+    __slots__ = ('left', 'right', 'op', '_expr_type')
+    display_name = 'bin-op'
+
+    valid_operators = {
         'int': ['+', '-', '*', '/', '%', '==', '!=', '>', '>=', '<', '>=', '<', '<='],
         'bool': ['==', '!=', '&&', '||'],
         'string': ['==', '!=', '+']
-    })
+    }
 
     int_to_bool_ops = ['==', '!=', '>', '>=', '<', '>=', '<', '<=']
 
     def __init__(self, line_number, left: Node, op: OperatorNode, right: Node):
         super().__init__(line_number)
-        self.display_name = 'bin-op'
         self.left = left
         self.right = right
         self.op = op
@@ -483,7 +627,7 @@ class BinOp(Node):
     def children(self):
         return [self.left, self.right]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         if self.op.symbol in self.int_to_bool_ops:
             return bool_symbol.expr_type
@@ -491,44 +635,48 @@ class BinOp(Node):
             return self.left.expr_type
 
     def __validate_node__(self):
-        self.issues = []
+        self._issues = None
         equal_types = self.left.expr_type == self.right.expr_type
         if not equal_types:
-            self.issues.append(
+            self.add_issue(
                 errors.TypeMismatch(self.left.expr_type, self.right.expr_type)
             )
             return False
 
         valid_operator = self.op.symbol in self.valid_operators.get(self.left.expr_type.type, [])
         if not valid_operator:
-            self.issues.append(
+            self.add_issue(
               errors.InvalidOperator(self.op.symbol, self.left.expr_type)
             )
         return valid_operator
 
     def lvm_operators_pos(self):
-        return op_to_instr[self.op.symbol]
+        return [op_to_instr[self.op.symbol]()]
 
 
 class ReferenceMode(Node):
+    __slots__ = ('mode_node', '_expr_type')
+    display_name = 'ref-mode'
+
     def __init__(self, line_number, mode):
         super().__init__(line_number)
-        self.display_name = 'ref-mode'
         self.mode_node = mode
 
     @property
     def children(self):
         return [self.mode_node]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return ExprType("reference", self.mode_node.expr_type)
 
 
 class LiteralRange(Node):
+    __slots__ = ('lower_bound', 'upper_bound')
+    display_name = 'literal-range'
+
     def __init__(self, line_number, lb: LiteralNode, ub: LiteralNode):
         super().__init__(line_number)
-        self.display_name = 'literal-range'
         self.lower_bound = lb
         self.upper_bound = ub
 
@@ -550,9 +698,11 @@ class LiteralRange(Node):
 
 
 class DiscreteRangeMode(Node):
+    __slots__ = ('mode_node', 'literal_range', '_expr_type')
+    display_name = 'discrete-range-mode'
+
     def __init__(self, line_number, mode, literal_range):
         super().__init__(line_number)
-        self.display_name = 'discrete-range-mode'
         self.mode_node = mode
         self.literal_range = literal_range
 
@@ -560,7 +710,7 @@ class DiscreteRangeMode(Node):
     def children(self):
         return [self.mode_node, self.literal_range]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return ExprType("discrete range", self.mode_node.expr_type)
 
@@ -570,9 +720,11 @@ class DiscreteRangeMode(Node):
 
 
 class StringMode(Node):
+    __slots__ = ('length',)
+    display_name = 'string-mode'
+
     def __init__(self, line_number, length):
         super().__init__(line_number)
-        self.display_name = 'string-mode'
         self.length = length
 
     @property
@@ -589,13 +741,15 @@ class StringMode(Node):
 
 
 class ArrayMode(Node):
+    __slots__ = ('index_mode_list', 'mode_node', '_children', '_expr_type')
+    display_name = 'array-mode'
+
     def __init__(self, line_number, index_mode_list: list, mode: Node=None):
         super().__init__(line_number)
-        self.display_name = 'array-mode'
         self.index_mode_list = index_mode_list
         self.mode_node = mode
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = list()
         c.append(ListNode(self.index_mode_list, 'index_mode_list'))
@@ -610,7 +764,7 @@ class ArrayMode(Node):
             l.append('mode')
         return l
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         return ExprType("array", self.mode_node.expr_type)
 
@@ -621,14 +775,16 @@ class ArrayMode(Node):
             cur_size *= dim.length
         return cur_size
 
-    def lvm_visitor(self):
-        return self.mode_node.lvm_visitor()
+    def lvm_parts(self):
+        return [self.mode_node]
 
 
 class NewModeStatement(Node):
+    __slots__ = ('new_mode_list',)
+    display_name = 'new-mode-stat'
+
     def __init__(self, line_number, new_mode_list):
         super().__init__(line_number)
-        self.display_name = 'new-mode-stat'
         self.new_mode_list = new_mode_list
 
     @property
@@ -637,15 +793,17 @@ class NewModeStatement(Node):
 
 
 class ModeDefinition(Node):
+    __slots__ = ('mode_node', 'identifier_list', '_children')
+    display_name = 'mode-def'
+
     def __init__(self, line_number, identifier_list, mode: Node):
         super().__init__(line_number)
-        self.display_name = 'mode-def'
         self.mode_node = mode
         self.identifier_list = identifier_list
         for id_node in self.identifier_list:
             id_node.usage = IdentifierUsage.DECLARATION
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         return [ListNode(self.identifier_list, 'identifiers'), self.mode_node]
 
@@ -653,40 +811,44 @@ class ModeDefinition(Node):
     def labels(self):
         return ['', 'mode']
 
-    def validation_visitor(self):
+    def enter_validation(self):
+        super().enter_validation()
         cur_context.insert_symbol(self.identifier_list, self.mode_node.expr_type, SymbolCategory.MODE, self)
-        return super().validation_visitor()
 
 
 class FormalParameter(Node):
+    __slots__ = ('parameter_spec', 'identifier_list', '_children', '_expr_type')
+    display_name = 'formal-param'
+
     def __init__(self, line_number, id_list, parameter_spec: Spec):
         super().__init__(line_number)
-        self.display_name = 'formal-param'
         self.parameter_spec = parameter_spec
         self.identifier_list = id_list
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         return [ListNode(self.identifier_list, 'id_list'), self.parameter_spec]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return self.parameter_spec.mode_node.expr_type
 
 
 class ProcedureDefinition(Node):
+    __slots__ = ('statement_list', 'formal_parameter_list', 'result_spec', '_children')
+    display_name = 'proc-def'
+
     def __init__(self,
                  line_number,
                  statement_list=None,
                  formal_parameter_list: List[FormalParameter]=None,
                  result_spec: Spec=None):
         super().__init__(line_number)
-        self.display_name = 'proc-def'
         self.statement_list = statement_list
         self.formal_parameter_list = formal_parameter_list
         self.result_spec = result_spec
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = []
         if self.statement_list:
@@ -702,12 +864,12 @@ class ProcedureDefinition(Node):
         result_expr_type = result_mode_node.expr_type
 
         valid = True
-        for statement in self.statement_list:
+        for statement in self.statement_list or []:
             # Check return action against expected return type
             if type(statement) == ActionStatement and type(statement.action) == ReturnAction:
                 ret_action = statement.action
                 if ret_action.expr_type != result_expr_type:
-                    ret_action.issues.append(
+                    ret_action.add_issue(
                         errors.TypeMismatch(result_expr_type, ret_action.expr_type)
                     )
                     valid = False
@@ -715,12 +877,15 @@ class ProcedureDefinition(Node):
 
 
 class ProcedureStatement(Node):
+    __slots__ = ('symbol', 'label_id', 'procedure_definition', 'mode', 'label_start', 'label_end')
+    display_name = 'proc-stat'
+    opens_scope = True
+
     def __init__(self, line_number, label_id: Identifier,
                  procedure_definition: ProcedureDefinition):
         super().__init__(line_number)
         self.symbol = None
 
-        self.display_name = 'proc-stat'
         self.label_id = label_id
         self.label_id.usage = IdentifierUsage.DECLARATION
         self.procedure_definition = procedure_definition
@@ -737,18 +902,20 @@ class ProcedureStatement(Node):
     def children(self):
         return [self.label_id, self.procedure_definition]
 
-    def validation_visitor(self) -> bool:
+    def enter_validation(self):
+        super().enter_validation()
         formal_params = self.procedure_definition.formal_parameter_list
 
-        procedure_symbol = cur_context.insert_procedure(self.label_id,
-                                                        self.mode.expr_type,
-                                                        start_label=self.label_start,
-                                                        declaration=self,
-                                                        formal_params=formal_params,
-                                                        display_level=len(cur_context.function_stack) + 1)
-        cur_context.symbol_env.push(self)
+        self.symbol = cur_context.insert_procedure(self.label_id,
+                                                   self.mode.expr_type,
+                                                   start_label=self.label_start,
+                                                   declaration=self,
+                                                   formal_params=formal_params,
+                                                   display_level=len(cur_context.function_stack) + 1)
+
+    def enter_scope(self):
+        procedure_symbol = self.symbol
         cur_context.function_stack.append(procedure_symbol)
-        self.symbol = procedure_symbol
 
         param_pos = 0
         for param in procedure_symbol.formal_params:
@@ -756,15 +923,13 @@ class ProcedureStatement(Node):
                 s_category = SymbolCategory.PARAM_REF if param.parameter_spec.is_reference else SymbolCategory.PARAM
                 s = VarSymbol(identifier.name, param.expr_type, s_category, self)
                 identifier.usage = IdentifierUsage.DECLARATION
-                cur_context.symbol_env.add_local(identifier.name,
+                cur_context.symbol_env.add_local(identifier.key,
                                                  s,
                                                  offset=param_pos-(procedure_symbol.num_args+2))
                 param_pos += 1
-        valid = super().validation_visitor()
 
-        cur_context.symbol_env.pop()
+    def leave_scope(self):
         cur_context.function_stack.pop()
-        return valid
 
     def lvm_operators_pre(self):
         return [
@@ -781,39 +946,45 @@ class ProcedureStatement(Node):
 
 
 class ReferenceLocation(Node):
+    __slots__ = ('location', '_expr_type')
+    display_name = 'ref-loc'
+
     def __init__(self, line_number, location):
         super().__init__(line_number)
-        self.display_name = 'ref-loc'
         self.location = location
 
     @property
     def children(self):
         return [self.location]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return ExprType("reference", self.location.expr_type)
 
 
 class DereferenceLocation(Node):
+    __slots__ = ('location', '_expr_type')
+    display_name = 'deref-loc'
+
     def __init__(self, line_number, location):
         super().__init__(line_number)
-        self.display_name = 'deref-loc'
         self.location = location
 
     @property
     def children(self):
         return [self.location]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return self.location.expr_type.detail
 
 
 class Slice(Node):
+    __slots__ = ('data_type', 'location', 'exp_begin', 'exp_end')
+    display_name = 'slice'
+
     def __init__(self, line_number, data_type, location, exp_begin, exp_end):
         super().__init__(line_number)
-        self.display_name = 'slice'
         self.data_type = data_type
         self.location = location
         self.exp_begin = exp_begin
@@ -825,9 +996,11 @@ class Slice(Node):
 
 
 class StringElement(Node):
+    __slots__ = ('location', 'element')
+    display_name = 'string-element'
+
     def __init__(self, line_number, location, element):
         super().__init__(line_number)
-        self.display_name = 'string-element'
         self.location = location
         self.element = element
 
@@ -845,15 +1018,17 @@ class StringElement(Node):
 
 
 class ArrayElement(Node):
+    __slots__ = ('usage', 'location', 'exp_list', '_children', '_expr_type')
+    display_name = 'array-element'
+
     def __init__(self, line_number, location, exp_list: list):
         super().__init__(line_number)
         self.usage = IdentifierUsage.VALUE_USAGE
-        self.display_name = 'array-element'
         self.location = location
         self.exp_list = exp_list
         self.location.usage = IdentifierUsage.REF_USAGE
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         return [self.location, ListNode(self.exp_list, 'elements')]
 
@@ -861,7 +1036,7 @@ class ArrayElement(Node):
     def labels(self):
         return ['array', '']
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         my_array_type = self.location.expr_type
         # Se tiver mais de um elemento, retorna outro array
@@ -878,9 +1053,11 @@ class ArrayElement(Node):
 
 
 class ElsIf(Node):
+    __slots__ = ('condition', 'action', '_expr_type')
+    display_name = 'elsif'
+
     def __init__(self, line_number, condition, action):
         super().__init__(line_number)
-        self.display_name = 'elsif'
         self.condition = condition
         self.action = action
 
@@ -888,21 +1065,23 @@ class ElsIf(Node):
     def children(self):
         return [self.condition, self.action]
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return self.action.expr_type
 
 
 class ConditionalExpression(Node):
+    __slots__ = ('condition_exp', 'action_exp', 'else_exp', 'elsif_list', '_children', '_expr_type')
+    display_name = 'cond-expr'
+
     def __init__(self, line_number, condition_exp: Node, action_exp: Node, else_exp: Node, elsif_list=None):
         super().__init__(line_number)
-        self.display_name = 'cond-expr'
         self.condition_exp = condition_exp
         self.action_exp = action_exp
         self.else_exp = else_exp
         self.elsif_list = elsif_list
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = [self.condition_exp, self.action_exp]
         if self.elsif_list:
@@ -918,13 +1097,13 @@ class ConditionalExpression(Node):
         c.append('else')
         return c
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         return self.action_exp.expr_type
 
     def __validate_node__(self):
         if self.action_exp.expr_type != self.else_exp.expr_type:
-            self.issues.append(
+            self.add_issue(
                 errors.TypeMismatch(self.action_exp.expr_type, self.else_exp.expr_type)
             )
             return False
@@ -932,9 +1111,11 @@ class ConditionalExpression(Node):
 
 
 class ActionStatement(Node):
+    __slots__ = ('action', 'label_id')
+    display_name = 'action-sttmnt'
+
     def __init__(self, line_number, action: Node, label_id: str =None):
         super().__init__(line_number)
-        self.display_name = 'action-sttmnt'
         self.action = action
         self.label_id = label_id
 
@@ -946,16 +1127,18 @@ class ActionStatement(Node):
             c.append(self.label_id)
         return c
 
-    def validation_visitor(self):
+    def enter_validation(self):
+        super().enter_validation()
         if self.label_id:
             cur_context.insert_symbol([self.label_id], self.action.expr_type, SymbolCategory.ACTION, self)
-        return super().validation_visitor()
 
 
 class AssigningOperator(Node):
+    __slots__ = ('closed_dyadic_op',)
+    display_name = 'assign-op'
+
     def __init__(self, line_number, closed_dyadic_op=None):
         super().__init__(line_number)
-        self.display_name = 'assign-op'
         self.closed_dyadic_op = closed_dyadic_op
 
     def __str__(self):
@@ -963,9 +1146,11 @@ class AssigningOperator(Node):
 
 
 class AssignmentAction(Node):
+    __slots__ = ('location', 'operator', 'expression')
+    display_name = 'assign-act'
+
     def __init__(self, line_number, location: Identifier, operator: AssigningOperator, expression):
         super().__init__(line_number)
-        self.display_name = 'assign-act'
         self.location = location
         self.location.usage = IdentifierUsage.ASSIGNMENT
         self.operator = operator
@@ -984,7 +1169,7 @@ class AssignmentAction(Node):
 
     def __validate_node__(self):
         if self.location.expr_type != self.expression.expr_type:
-            self.issues.append(
+            self.add_issue(
                 errors.TypeMismatch(self.location.expr_type, self.expression.expr_type)
             )
             return False
@@ -995,9 +1180,11 @@ class AssignmentAction(Node):
 
 
 class ReturnAction(Node):
+    __slots__ = ('expression', 'function_symbol', '_expr_type')
+    display_name = 'return'
+
     def __init__(self, line_number, expression=None):
         super().__init__(line_number)
-        self.display_name = 'return'
         self.expression = expression
         self.function_symbol = None
 
@@ -1005,7 +1192,7 @@ class ReturnAction(Node):
     def children(self):
         return [self.expression] if self.expression else []
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self):
         return self.expression.expr_type
 
@@ -1020,13 +1207,15 @@ class ReturnAction(Node):
 
 
 class FuncCallBase(Node):
+    __slots__ = ('identifier', 'arg_list', '_children', '_expr_type')
+    display_name = 'func-call'
+
     def __init__(self, line_number, identifier: Identifier, exp_list=None):
         super().__init__(line_number)
-        self.display_name = 'func-call'
         self.identifier = identifier
         self.arg_list = exp_list
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = list()
         c.append(self.identifier)
@@ -1038,20 +1227,20 @@ class FuncCallBase(Node):
     def labels(self):
         return ['id', '']
 
-    @property
+    @memoized('_expr_type')
     def expr_type(self) -> ExprType:
         return self.identifier.expr_type
 
     def __validate_node__(self):
         func_symbol = self.identifier.symbol
         if type(func_symbol) is not ProcedureSymbol:
-            self.issues.append(
+            self.add_issue(
                 errors.CallingNonCallable(self.identifier.name)
             )
             return False
         if func_symbol.num_args is not None:
             if func_symbol.num_args != len(self.arg_list or []):
-                self.issues.append(
+                self.add_issue(
                     errors.ArgCountError(func_symbol.name, func_symbol.num_args, len(self.arg_list or []))
                 )
                 return False
@@ -1068,9 +1257,11 @@ class FuncCallBase(Node):
 
 
 class BuiltinCall(FuncCallBase):
+    __slots__ = ()
+    display_name = 'builtin-call'
+
     def __init__(self, *args):
         super().__init__(*args)
-        self.display_name = 'builtin-call'
 
     def __validate_node__(self):
         if self.identifier.symbol.name == 'READ':
@@ -1092,13 +1283,15 @@ class BuiltinCall(FuncCallBase):
 
 
 class BuiltinName(Identifier):
-    pass
+    __slots__ = ()
 
 
 class ProcedureCall(FuncCallBase):
+    __slots__ = ()
+    display_name = 'procedure-call'
+
     def __init__(self, *args):
         super().__init__(*args)
-        self.display_name = 'procedure-call'
 
     def lvm_operators_pre(self):
         return [
@@ -1113,9 +1306,10 @@ class ProcedureCall(FuncCallBase):
 
 
 class StepEnumeration(Node):
+    __slots__ = ('up', 'identifier', 'from_exp', 'to_exp', 'step_val', 'loop_label')
+
     def __init__(self, line_number, up, identifier: Identifier, from_exp, to_exp, step_val=None):
         super().__init__(line_number)
-        self.display_name = "enum-up" if up else "enum-down"
         self.up = up
         self.identifier = identifier
         self.identifier.usage = IdentifierUsage.ASSIGNMENT
@@ -1124,6 +1318,10 @@ class StepEnumeration(Node):
         self.step_val = step_val
         self.loop_label = None
 
+    @property
+    def display_name(self):
+        return 'enum-up' if self.up else 'enum-down'
+
     @property
     def children(self):
         c = [self.identifier, self.from_exp, self.to_exp]
@@ -1138,49 +1336,56 @@ class StepEnumeration(Node):
             e.append('step-val')
         return e
 
-    def lvm_visitor(self):
-        # INITIALIZATION
-        operators = self.from_exp.lvm_visitor()
-        operators += [LVM.StoreValueOperator(self.identifier.symbol.display_level, self.identifier.symbol.offset)]
-        operators += [LVM.JumpOperator(self.loop_label + 2)]
-
-        # STEP
-        operators += [LVM.DefineLabelOperator(self.loop_label)]
-        operators += [LVM.LoadValueOperator(self.identifier.symbol.display_level, self.identifier.symbol.offset)]
-        operators += self.step_val.lvm_visitor() if self.step_val else [LVM.LoadConstantOperator(1 if self.up else -1)]
-        operators += [LVM.AddOperator()]
-        operators += [LVM.StoreValueOperator(self.identifier.symbol.display_level, self.identifier.symbol.offset)]
-
-        # COMPARE
-        operators += [LVM.DefineLabelOperator(self.loop_label + 2)]
-        operators += [LVM.LoadValueOperator(self.identifier.symbol.display_level, self.identifier.symbol.offset)]
-        operators += self.to_exp.lvm_visitor()
-        operators += [LVM.LessOrEqualOperator()] if self.up else [LVM.GreaterOrEqualOperator()]
-        return operators
+    def lvm_parts(self):
+        symbol = self.identifier.symbol
+        return [
+            # INITIALIZATION
+            self.from_exp,
+            [LVM.StoreValueOperator(symbol.display_level, symbol.offset),
+             LVM.JumpOperator(self.loop_label + 2),
+             # STEP
+             LVM.DefineLabelOperator(self.loop_label),
+             LVM.LoadValueOperator(symbol.display_level, symbol.offset)],
+            self.step_val if self.step_val else [LVM.LoadConstantOperator(1 if self.up else -1)],
+            [LVM.AddOperator(),
+             LVM.StoreValueOperator(symbol.display_level, symbol.offset),
+             # COMPARE
+             LVM.DefineLabelOperator(self.loop_label + 2),
+             LVM.LoadValueOperator(symbol.display_level, symbol.offset)],
+            self.to_exp,
+            [LVM.LessOrEqualOperator()] if self.up else [LVM.GreaterOrEqualOperator()],
+        ]
 
 
 class RangeEnum(Node):
+    __slots__ = ('up', 'identifier', 'discrete_mode', 'loop_label')
+
     def __init__(self, line_number, up, identifier, discrete_mode):
         super().__init__(line_number)
-        self.display_name = "rng-up" if up else "rng-down"
         self.up = up
         self.identifier = identifier
         self.identifier.usage = IdentifierUsage.ASSIGNMENT
         self.discrete_mode = discrete_mode
 
+    @property
+    def display_name(self):
+        return 'rng-up' if self.up else 'rng-down'
+
     @property
     def children(self):
         return [self.identifier, self.discrete_mode]
     #
-    # def validation_visitor(self) -> bool:
+    # def enter_validation(self):
+    #     super().enter_validation()
     #     cur_context.insert_symbol([self.identifier], int_symbol.expr_type, SymbolCategory.VARIABLE, self)
-    #     return super().validation_visitor()
 
 
 class ControlPart(Node):
+    __slots__ = ('for_ctrl', 'while_ctrl', 'label_number')
+    display_name = 'ctrl-part'
+
     def __init__(self, line_number, for_ctrl=None, while_ctrl=None):
         super().__init__(line_number)
-        self.display_name = 'ctrl-part'
         self.for_ctrl = for_ctrl
         self.while_ctrl = while_ctrl
         self.label_number = None
@@ -1215,9 +1420,11 @@ class ControlPart(Node):
 
 
 class DoAction(Node):
+    __slots__ = ('ctrl_part', 'action_st_list', 'label_number', '_children')
+    display_name = 'do-act'
+
     def __init__(self, line_number, ctrl_part=None, action_st_list=None):
         super().__init__(line_number)
-        self.display_name = 'do-act'
         self.ctrl_part = ctrl_part
         self.action_st_list = action_st_list
         self.label_number = cur_context.label_count
@@ -1225,7 +1432,7 @@ class DoAction(Node):
             self.ctrl_part.label_number = self.label_number
         cur_context.label_count += 3
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = []
         if self.ctrl_part:
@@ -1247,9 +1454,11 @@ class DoAction(Node):
 
 
 class ConditionalBlock(Node):
+    __slots__ = ('expression', 'then_clause', 'exit_label_number', 'block_end_label_number')
+    display_name = 'cond-block'
+
     def __init__(self, line_number, expression, then_clause):
         super().__init__(line_number)
-        self.display_name = 'cond-block'
         self.expression = expression
         self.then_clause = then_clause
         self.exit_label_number = None
@@ -1263,19 +1472,22 @@ class ConditionalBlock(Node):
     def labels(self):
         return ['exp', 'then']
 
-    def lvm_visitor(self):
-        operators = self.expression.lvm_visitor()
-        operators.append(LVM.JumpOnFalseOperator(self.block_end_label_number))
-        operators += self.then_clause.lvm_visitor()
-        operators += [LVM.JumpOperator(self.exit_label_number),
-                      LVM.DefineLabelOperator(self.block_end_label_number)]
-        return operators
+    def lvm_parts(self):
+        return [
+            self.expression,
+            [LVM.JumpOnFalseOperator(self.block_end_label_number)],
+            self.then_clause,
+            [LVM.JumpOperator(self.exit_label_number),
+             LVM.DefineLabelOperator(self.block_end_label_number)],
+        ]
 
 
 class IfAction(Node):
+    __slots__ = ('if_block', 'elsif_list', 'else_clause', 'initial_label_number', 'final_label_number', '_children')
+    display_name = 'if-act'
+
     def __init__(self, line_number, expression, then_clause, elsif_list=None, else_clause=None):
         super().__init__(line_number)
-        self.display_name = 'if-act'
         self.if_block = ConditionalBlock(line_number, expression, then_clause)
         self.elsif_list = elsif_list or []
         self.else_clause = else_clause
@@ -1293,7 +1505,7 @@ class IfAction(Node):
             node.block_end_label_number = self.initial_label_number + i + 1
             node.exit_label_number = self.final_label_number
 
-    @property
+    @memoized('_children', once_valid=False)
     def children(self):
         c = list()
         c.append(self.if_block)
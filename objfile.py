@@ -0,0 +1,163 @@
+"""
+Binary object files holding a compiled LYA program: the LVM operator list
+and the H string table, behind a header with the format version and the
+hash of the source they were built from.
+
+    header   magic b'LYAO', version, flags, sha256 of the source,
+             number of operators, number of H strings
+    code     per operator: opcode, operand count, tagged operands
+    strings  the H table
+"""
+import hashlib
+import struct
+
+import LVM
+
+MAGIC = b'LYAO'
+# Bump whenever opcodes or the layout below change
+VERSION = 1
+FLAG_OPTIMIZED = 1
+
+HEADER = struct.Struct('<4sHH32sII')
+OPERATOR = struct.Struct('<BB')
+TAG = struct.Struct('<B')
+INT = struct.Struct('<q')
+LENGTH = struct.Struct('<I')
+
+# Operand tags; ints outside int64 are kept as decimal text
+NONE, INTEGER, BOOLEAN, STRING, BIG_INTEGER = range(5)
+
+
+def source_hash(source):
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    return hashlib.sha256(source).digest()
+
+
+class ObjectFile:
+    def __init__(self, program, H=(), digest=bytes(32), flags=0, version=VERSION):
+        self.program = program
+        self.H = list(H)
+        self.digest = digest
+        self.flags = flags
+        self.version = version
+
+    @property
+    def optimized(self):
+        return bool(self.flags & FLAG_OPTIMIZED)
+
+    def is_current(self, source, optimized):
+        """Whether this object was built by this format from `source`."""
+        return (self.version == VERSION and self.digest == source_hash(source)
+                and self.optimized == optimized)
+
+    def bytecode(self):
+        return LVM.decode(self.program)
+
+    def lvm(self, **options):
+        lvm = LVM.LVM(self.program, **options)
+        lvm.H = list(self.H)
+        return lvm
+
+
+def pack_string(text):
+    data = text.encode('utf-8')
+    return LENGTH.pack(len(data)) + data
+
+
+def pack_operand(value):
+    if value is None:
+        return TAG.pack(NONE)
+    if type(value) is bool:
+        return TAG.pack(BOOLEAN) + TAG.pack(value)
+    if type(value) is int:
+        if -(1 << 63) <= value < (1 << 63):
+            return TAG.pack(INTEGER) + INT.pack(value)
+        return TAG.pack(BIG_INTEGER) + pack_string(str(value))
+    if type(value) is str:
+        return TAG.pack(STRING) + pack_string(value)
+    raise TypeError("cannot store operand {!r} in an object file".format(value))
+
+
+def dumps(program, source, H=(), optimized=False):
+    chunks = [HEADER.pack(MAGIC, VERSION, FLAG_OPTIMIZED if optimized else 0,
+                          source_hash(source), len(program), len(H))]
+    for op in program:
+        operands = op.operands
+        # Trailing None operands are implied by the operand count
+        count = len(operands)
+        while count and operands[count - 1] is None:
+            count -= 1
+        chunks.append(OPERATOR.pack(op.opcode, count))
+        chunks += [pack_operand(value) for value in operands[:count]]
+    chunks += [pack_string(text) for text in H]
+    return b''.join(chunks)
+
+
+def dump(path, program, source, H=(), optimized=False):
+    with open(path, 'wb') as file:
+        file.write(dumps(program, source, H, optimized))
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, layout):
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def string(self):
+        length, = self.unpack(LENGTH)
+        text = self.data[self.offset:self.offset + length].decode('utf-8')
+        self.offset += length
+        return text
+
+    def operand(self):
+        tag, = self.unpack(TAG)
+        if tag == NONE:
+            return None
+        if tag == INTEGER:
+            return self.unpack(INT)[0]
+        if tag == BOOLEAN:
+            return bool(self.unpack(TAG)[0])
+        if tag == STRING:
+            return self.string()
+        if tag == BIG_INTEGER:
+            return int(self.string())
+        raise ValueError("bad operand tag {} in object file".format(tag))
+
+
+def read_header(data):
+    if len(data) < HEADER.size:
+        raise ValueError("object file is truncated")
+    magic, version, flags, digest, n_operators, n_strings = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not an LVM object file")
+    return version, flags, digest, n_operators, n_strings
+
+
+def loads(data):
+    """
+    Rebuilds the ObjectFile. Only the header of a file from another format
+    version is read, so is_current() can tell it must be rebuilt.
+    """
+    version, flags, digest, n_operators, n_strings = read_header(data)
+    if version != VERSION:
+        return ObjectFile([], (), digest, flags, version)
+    reader = Reader(data)
+    reader.offset = HEADER.size
+    program = []
+    for _ in range(n_operators):
+        opcode, count = reader.unpack(OPERATOR)
+        operands = [reader.operand() for _ in range(count)]
+        program.append(LVM.OPERATOR_FOR_OPCODE[opcode](*operands))
+    H = [reader.string() for _ in range(n_strings)]
+    return ObjectFile(program, H, digest, flags, version)
+
+
+def load(path):
+    with open(path, 'rb') as file:
+        return loads(file.read())
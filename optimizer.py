@@ -0,0 +1,259 @@
+import LVM
+
+
+class PeepholeRule:
+    """
+    A rewrite pass over an operator list. Rules build new operators instead
+    of changing the ones they receive, which are immutable and interned.
+    """
+    def run(self, operators):
+        return operators
+
+
+class WindowRule(PeepholeRule):
+    """
+    Slides a window of `size` operators over the list and replaces it by
+    whatever rewrite() returns, unless that is None.
+    """
+    size = 1
+
+    def rewrite(self, window):
+        return None
+
+    def run(self, operators):
+        result = []
+        i = 0
+        while i < len(operators):
+            window = operators[i:i + self.size]
+            replacement = self.rewrite(window) if len(window) == self.size else None
+            if replacement is None:
+                result.append(operators[i])
+                i += 1
+            else:
+                result += replacement
+                i += self.size
+        return result
+
+
+def is_number(op):
+    # Strings are pushed by ldc too, but they are never folded
+    return op.opcode == LVM.LDC and type(op.op1) in (int, bool)
+
+
+class ConstantFolding(WindowRule):
+    size = 3
+
+    def rewrite(self, window):
+        a, b, op = window
+        if not (is_number(a) and is_number(b) and isinstance(op, LVM.BinOPOperator)):
+            return None
+        if op.opcode in (LVM.DIV, LVM.MOD) and b.op1 == 0:
+            return None
+        return [LVM.LoadConstantOperator(op.operator(a.op1, b.op1))]
+
+
+class UnaryConstantFolding(WindowRule):
+    size = 2
+
+    def rewrite(self, window):
+        a, op = window
+        if not (is_number(a) and isinstance(op, LVM.UnOPOperator)):
+            return None
+        return [LVM.LoadConstantOperator(op.operator(a.op1))]
+
+
+class AddZeroRemoval(WindowRule):
+    size = 2
+
+    def rewrite(self, window):
+        a, op = window
+        if a.opcode == LVM.LDC and type(a.op1) is int and a.op1 == 0 and op.opcode in (LVM.ADD, LVM.SUB):
+            return []
+        return None
+
+
+def label_index(op):
+    """Position of the label operand of a jump, or None."""
+    if 'label' in op.operand_kinds:
+        return op.operand_kinds.index('label')
+    return None
+
+
+def label_targets(operators):
+    """Maps each label to the first non-label operator following it."""
+    targets = {}
+    pending = []
+    for op in operators:
+        if op.opcode == LVM.LBL:
+            pending.append(op.op1)
+        else:
+            for label in pending:
+                targets[label] = op
+            pending = []
+    return targets
+
+
+class JumpThreading(PeepholeRule):
+    def run(self, operators):
+        targets = label_targets(operators)
+        result = []
+        for op in operators:
+            i = label_index(op)
+            if i is not None and op.opcode != LVM.CFU:
+                operands = list(op.operands)
+                label = operands[i]
+                seen = {label}
+                target = targets.get(label)
+                while target is not None and target.opcode == LVM.JMP and target.op1 not in seen:
+                    label = target.op1
+                    seen.add(label)
+                    target = targets.get(label)
+                if label != operands[i]:
+                    operands[i] = label
+                    op = type(op)(*operands)
+            result.append(op)
+        return result
+
+
+class JumpToNextRemoval(PeepholeRule):
+    def run(self, operators):
+        result = []
+        for i, op in enumerate(operators):
+            if op.opcode == LVM.JMP:
+                j = i + 1
+                while j < len(operators) and operators[j].opcode == LVM.LBL:
+                    if operators[j].op1 == op.op1:
+                        break
+                    j += 1
+                if j < len(operators) and operators[j].opcode == LVM.LBL:
+                    continue
+            result.append(op)
+        return result
+
+
+class DeadCodeRemoval(PeepholeRule):
+    terminators = (LVM.JMP, LVM.RET, LVM.END)
+
+    def run(self, operators):
+        result = []
+        reachable = True
+        for op in operators:
+            if op.opcode == LVM.LBL:
+                reachable = True
+            if reachable:
+                result.append(op)
+            if op.opcode in self.terminators:
+                reachable = False
+        return result
+
+
+class UnusedLabelRemoval(PeepholeRule):
+    def run(self, operators):
+        used = {op.operands[label_index(op)] for op in operators if label_index(op) is not None}
+        return [op for op in operators if op.opcode != LVM.LBL or op.op1 in used]
+
+
+class IncrementFusion(WindowRule):
+    # ldv l o; ldc k; add; stv l o -> inc l o k, emitted for every loop step
+    size = 4
+
+    def rewrite(self, window):
+        load, const, add, store = window
+        if load.opcode != LVM.LDV or store.opcode != LVM.STV or add.opcode != LVM.ADD:
+            return None
+        if (load.op1, load.op2) != (store.op1, store.op2) or not is_number(const):
+            return None
+        return [LVM.IncrementValueOperator(load.op1, load.op2, const.op1)]
+
+
+class LoadIndexedFusion(WindowRule):
+    # idx k; lmv 1 -> lxv k, emitted for every array element read
+    size = 2
+
+    def rewrite(self, window):
+        index, load = window
+        if index.opcode == LVM.IDX and load.opcode == LVM.LMV and load.op1 == 1:
+            return [LVM.LoadIndexedValueOperator(index.op1)]
+        return None
+
+
+class GuardFusion(WindowRule):
+    # ldv l o; ldc k; les/leq; jof L -> jnl l o k L, for loop guards against
+    # a constant bound; x <= k is rewritten as x < k + 1
+    size = 4
+
+    def rewrite(self, window):
+        load, const, compare, jump = window
+        if load.opcode != LVM.LDV or jump.opcode != LVM.JOF or compare.opcode not in (LVM.LES, LVM.LEQ):
+            return None
+        if const.opcode != LVM.LDC or type(const.op1) is not int:
+            return None
+        bound = const.op1 + 1 if compare.opcode == LVM.LEQ else const.op1
+        return [LVM.JumpNotLessOperator(load.op1, load.op2, bound, jump.op1)]
+
+
+class LoadConstantBinOPFusion(WindowRule):
+    # ldv l o; ldc k; <binop> -> lcb l o k <binop>
+    size = 3
+
+    def rewrite(self, window):
+        load, const, binop = window
+        if load.opcode == LVM.LDV and is_number(const) and isinstance(binop, LVM.BinOPOperator):
+            return [LVM.LoadConstantBinOPOperator(load.op1, load.op2, const.op1, binop.opcode)]
+        return None
+
+
+class LoadLoadBinOPFusion(WindowRule):
+    # ldv l o1; ldv l o2; <binop> -> llb l o1 o2 <binop>
+    size = 3
+
+    def rewrite(self, window):
+        first, second, binop = window
+        if first.opcode != LVM.LDV or second.opcode != LVM.LDV or first.op1 != second.op1:
+            return None
+        if isinstance(binop, LVM.BinOPOperator):
+            return [LVM.LoadLoadBinOPOperator(first.op1, first.op2, second.op2, binop.opcode)]
+        return None
+
+
+class CompareJumpFusion(WindowRule):
+    # <binop>; jof L -> cjf L <binop>
+    size = 2
+
+    def rewrite(self, window):
+        binop, jump = window
+        if isinstance(binop, LVM.BinOPOperator) and jump.opcode == LVM.JOF:
+            return [LVM.CompareJumpOnFalseOperator(jump.op1, binop.opcode)]
+        return None
+
+
+DEFAULT_RULES = [
+    ConstantFolding(),
+    UnaryConstantFolding(),
+    AddZeroRemoval(),
+    JumpThreading(),
+    JumpToNextRemoval(),
+    UnusedLabelRemoval(),
+    DeadCodeRemoval(),
+    IncrementFusion(),
+    LoadIndexedFusion(),
+    GuardFusion(),
+    LoadConstantBinOPFusion(),
+    LoadLoadBinOPFusion(),
+    CompareJumpFusion(),
+]
+
+
+class PeepholeOptimizer:
+    def __init__(self, rules=None, max_passes=10):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.max_passes = max_passes
+
+    def optimize(self, operators):
+        for _ in range(self.max_passes):
+            before = operators
+            for rule in self.rules:
+                operators = rule.run(operators)
+            if len(before) == len(operators) and all(a is b for a, b in zip(before, operators)):
+                break
+        return operators
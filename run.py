@@ -1,32 +1,107 @@
-from lyaparser import PeterParser
+from compiler import Compiler
 from visualization import make_html
-from visitors import semantic_visitor
 from LVM import LVM
+from memory import MEMORY_BACKENDS
+from channels import StreamSink, ConsoleSource, BufferSource
+import objfile
+import argparse
+import os
 import sys
 
-if __name__ == '__main__':
-    file_name = sys.argv[1]
-    file = open(file_name)
-    data = file.read()
-
-    # Build the parser
-    pp = PeterParser()
-    AST = pp.parse(data)
-    if AST:
-        AST.validation_visitor()
-        semantic_visitor.visit_tree(AST)
-
-        html = make_html(AST)
+
+# PLY tables are cached here between runs, see PeterParser
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__lyacache__')
+
+
+def build(data, file_name, optimize, table_dir=TABLE_DIR, fast_scanner=False):
+    """Runs the front end and codegen, returning None for invalid programs."""
+    compiler = Compiler(optimize=optimize, table_dir=table_dir, fast_scanner=fast_scanner)
+    inst_list = compiler.compile(data)
+    if compiler.ast:
+        html = make_html(compiler.ast)
         with open("{}.ast.html".format(file_name), 'w') as html_file:
             html_file.write(html)
+    return inst_list
+
 
-        if AST.is_valid:
-            inst_list = AST.lvm_visitor()
-            print(inst_list)
-            print("STARTING PROGRAM")
+def load_program(file_name, args):
+    """
+    Returns the operator list and H table to run. With --object, the
+    program is kept in <file>.obj and only rebuilt when the source changes.
+    """
+    if file_name.endswith('.obj'):
+        obj = objfile.load(file_name)
+        if obj.version != objfile.VERSION:
+            raise SystemExit("{} was built by another version, rebuild it from its source".format(file_name))
+        return obj.program, obj.H
+
+    with open(file_name) as file:
+        data = file.read()
+    obj_name = "{}.obj".format(file_name)
+    if args.object and os.path.exists(obj_name):
+        obj = objfile.load(obj_name)
+        if obj.is_current(data, args.optimize):
+            return obj.program, obj.H
+
+    inst_list = build(data, file_name, args.optimize, args.table_dir, args.scanner == 'fast')
+    if inst_list is not None and args.object:
+        objfile.dump(obj_name, inst_list, data, optimized=args.optimize)
+    return inst_list, []
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('file_name')
+    arg_parser.add_argument('--no-optimize', dest='optimize', action='store_false',
+                            help="skip the peephole optimizer")
+    arg_parser.add_argument('--memory', choices=sorted(MEMORY_BACKENDS), default='list',
+                            help="LVM memory backend; array and numpy keep int64 cells")
+    arg_parser.add_argument('--stack-size', type=int, default=10000,
+                            help="initial number of LVM memory cells, grown on demand")
+    arg_parser.add_argument('--flush', choices=StreamSink.FLUSH_POLICIES, default='full',
+                            help="when program output is written; it is always flushed before reads")
+    arg_parser.add_argument('--input', metavar='FILE',
+                            help="read program input from FILE instead of stdin")
+    arg_parser.add_argument('--words', action='store_true',
+                            help="split input on any whitespace instead of one value per line")
+    arg_parser.add_argument('--object', action='store_true',
+                            help="keep the compiled program in <file>.obj and reuse it while the source is unchanged")
+    arg_parser.add_argument('--table-dir', default=TABLE_DIR,
+                            help="where the lexer and parser tables are cached")
+    arg_parser.add_argument('--scanner', choices=('ply', 'fast'), default='ply',
+                            help="tokenize with the PLY lexer or the hand-written scanner")
+    arg_parser.add_argument('--jit', action='store_true',
+                            help="run the program compiled to Python instead of interpreting it")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="count how often each opcode pair runs back to back, in the code as "
+                                 "optimized; add --no-optimize to find pairs worth fusing")
+    args = arg_parser.parse_args()
+    inst_list, H = load_program(args.file_name, args)
+    if inst_list is not None:
+        print(inst_list)
+        print("STARTING PROGRAM")
 
-            #lvm = LVM(lvm_visitor.result)
-            lvm = LVM(inst_list)
+        #lvm = LVM(lvm_visitor.result)
+        if args.input:
+            with open(args.input, 'rb') as input_file:
+                source = BufferSource(input_file, words=args.words)
+        elif sys.stdin.isatty() and not args.words:
+            source = ConsoleSource()
+        else:
+            # Piped input is read and converted in one go
+            source = BufferSource(sys.stdin, words=args.words)
+        lvm = LVM(inst_list, memory=args.memory, stack_size=args.stack_size,
+                  output=StreamSink(flush=args.flush), input=source)
+        lvm.H = H
+        if args.profile:
+            bigrams = lvm.profile()
+        elif args.jit:
+            lvm.run_compiled()
+        else:
             lvm.run()
-            print("DONE---Printing Stack")
-            print(lvm.stack())
\ No newline at end of file
+        print("DONE---Printing Stack")
+        print(lvm.stack())
+        if args.profile:
+            print("OPCODE PAIRS")
+            for (first, second), count in bigrams.most_common():
+                print("{:>10} {} {}".format(count, first, second))
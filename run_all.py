@@ -0,0 +1,148 @@
+"""
+Compiles and runs many LYA programs in parallel, one warm Compiler per
+worker process, and reports on every program in one JSON file. Like the
+old run_all.sh it also writes each .ast.html and an index.html linking
+them.
+
+    $ python3 run_all.py                       # examples/*.lya
+    $ python3 run_all.py 'tests/**/*.lya' --jobs 8 --input-dir inputs
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+
+from channels import StringSink
+from compiler import Compiler
+from visualization import make_html
+
+# The session of each worker process, built once by start_worker
+compiler = None
+
+
+def start_worker(optimize, table_dir):
+    global compiler
+    compiler = Compiler(optimize=optimize, table_dir=table_dir)
+
+
+def input_for(file_name, input_dir):
+    """The contents of <input_dir>/<name>.in for <name>.lya, or no input."""
+    if input_dir is None:
+        return ''
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    path = os.path.join(input_dir, stem + '.in')
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def run_file(file_name, input_dir=None, jit=False):
+    report = {
+        'file': file_name,
+        'valid': False,
+        'diagnostics': [],
+        'compiler_output': '',
+        'instructions': None,
+        'output': None,
+        'stack': None,
+        'error': None,
+        'timing': {},
+    }
+    messages = io.StringIO()
+    try:
+        with open(file_name) as file:
+            data = file.read()
+        start = time.perf_counter()
+        # Syntax errors are printed by the parser
+        with contextlib.redirect_stdout(messages):
+            program = compiler.compile(data)
+        report['timing']['compile'] = time.perf_counter() - start
+        report['diagnostics'] = compiler.diagnostics()
+        if compiler.ast:
+            with open("{}.ast.html".format(file_name), 'w') as html_file:
+                html_file.write(make_html(compiler.ast))
+        if program is not None:
+            report['valid'] = True
+            report['instructions'] = len(program)
+            start = time.perf_counter()
+            lvm = compiler.run(program, input_for(file_name, input_dir), jit=jit, output=StringSink())
+            report['timing']['run'] = time.perf_counter() - start
+            report['output'] = lvm.output.getvalue()
+            report['stack'] = lvm.stack()
+    except Exception as e:
+        report['error'] = "{}: {}".format(type(e).__name__, e)
+    report['compiler_output'] = messages.getvalue()
+    return report
+
+
+def expand(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        files += matches if matches else [pattern]
+    return files
+
+
+def write_index(reports, index_name):
+    with open(index_name, 'w') as index:
+        index.write("<html><body>\n")
+        for report in reports:
+            path = os.path.abspath(report['file'])
+            index.write("<a href=\"file:///{}.ast.html\">{}</a><br>\n".format(path, report['file']))
+        index.write("</body></html>\n")
+
+
+def status(report):
+    if report['error']:
+        return "error ({})".format(report['error'])
+    if not report['valid']:
+        return "invalid, {} issues".format(len(report['diagnostics']))
+    return "ok, {} instructions, {:.3f}s".format(report['instructions'], sum(report['timing'].values()))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('files', nargs='*', default=['examples/*.lya'],
+                            help="LYA files or glob patterns, examples/*.lya by default")
+    arg_parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                            help="number of worker processes")
+    arg_parser.add_argument('--input-dir',
+                            help="directory with a <name>.in input file for each <name>.lya")
+    arg_parser.add_argument('--report', default='report.json',
+                            help="where the JSON report is written")
+    arg_parser.add_argument('--index', default='index.html',
+                            help="where the page linking every AST is written")
+    arg_parser.add_argument('--no-optimize', dest='optimize', action='store_false',
+                            help="skip the peephole optimizer")
+    arg_parser.add_argument('--table-dir',
+                            default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '__lyacache__'),
+                            help="where the lexer and parser tables are cached")
+    arg_parser.add_argument('--jit', action='store_true',
+                            help="run the programs compiled to Python")
+    args = arg_parser.parse_args()
+
+    files = expand(args.files)
+    # Build the tables once, before the workers load them
+    Compiler(table_dir=args.table_dir)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.jobs, initializer=start_worker,
+                             initargs=(args.optimize, args.table_dir)) as executor:
+        reports = list(executor.map(run_file, files, [args.input_dir] * len(files),
+                                    [args.jit] * len(files)))
+    elapsed = time.perf_counter() - start
+
+    for report in reports:
+        print("{}: {}".format(report['file'], status(report)))
+    with open(args.report, 'w') as report_file:
+        json.dump({'files': reports, 'elapsed': elapsed}, report_file, indent=2)
+    write_index(reports, args.index)
+    print("{} files in {:.2f}s, report in {}".format(len(reports), elapsed, args.report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+A hand-written scanner producing the same tokens as LexerLuthor without
+the PLY master regex: it dispatches on the first character of every
+token and only uses small anchored regexes to find where identifiers,
+numbers and character literals end.
+
+    pp = PeterParser()
+    AST = pp.parse(data, lexer=FastScanner())
+"""
+import re
+
+from ply.lex import LexToken
+
+from lyalex import LexerLuthor, char_constant_value
+
+ID = re.compile(r'[a-zA-Z_][a-zA-Z_0-9]*')
+ICONST = re.compile(r'\d+')
+CCONST = re.compile(LexerLuthor.t_CCONST.__doc__)
+ID_START = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+IGNORE = frozenset(LexerLuthor.t_ignore)
+
+
+def operator_table():
+    """
+    Maps the first character of every operator to its (text, type) pairs,
+    longest first, as the master regex tries longer patterns first.
+    """
+    table = {}
+    for name in LexerLuthor.tokens:
+        pattern = getattr(LexerLuthor, 't_' + name, None)
+        if isinstance(pattern, str):
+            text = re.sub(r'\\(.)', r'\1', pattern)
+            table.setdefault(text[0], []).append((text, name))
+    for candidates in table.values():
+        candidates.sort(key=lambda candidate: -len(candidate[0]))
+    return table
+
+
+OPERATORS = operator_table()
+
+
+class FastScanner(object):
+    """
+    Drop-in replacement for the PLY lexer of LexerLuthor: it provides
+    input(), token() and lineno, reports the same errors and, like PLY,
+    keeps counting lines across inputs.
+    """
+    def __init__(self):
+        self.reserved = LexerLuthor.reserved
+        self.lineno = 1
+        self.lexpos = 0
+        self.tokens = iter(())
+
+    def input(self, data, start=0):
+        """Scans `data` from offset `start`; token positions stay offsets into `data`."""
+        self.tokens = self.scan(data, start)
+
+    def token(self):
+        return next(self.tokens, None)
+
+    def __iter__(self):
+        return self.tokens
+
+    def make(self, type, value, lexpos):
+        tok = LexToken()
+        tok.type = type
+        tok.value = value
+        tok.lineno = self.lineno
+        tok.lexpos = lexpos
+        tok.lexer = self
+        return tok
+
+    def scan(self, data, pos=0):
+        reserved = self.reserved
+        operators = OPERATORS
+        make = self.make
+        end = len(data)
+        while pos < end:
+            c = data[pos]
+            if c in IGNORE:
+                pos += 1
+            elif c in ID_START:
+                value = ID.match(data, pos).group()
+                yield make(reserved.get(value, 'ID'), value, pos)
+                pos += len(value)
+            elif c == '\n':
+                start = pos
+                while pos < end and data[pos] == '\n':
+                    pos += 1
+                self.lineno += pos - start
+            elif c.isdecimal():
+                value = ICONST.match(data, pos).group()
+                yield make('ICONST', int(value), pos)
+                pos += len(value)
+            elif c in operators and not (c == '/' and data.startswith(('//', '/*'), pos)):
+                for text, type in operators[c]:
+                    if data.startswith(text, pos):
+                        yield make(type, text, pos)
+                        pos += len(text)
+                        break
+                else:
+                    # A single '|' starts no operator
+                    print("Illegal character '%s'" % c)
+                    pos += 1
+            elif c == '/':
+                pos = self.comment(data, pos)
+            elif c == '"':
+                close = data.find('"', pos + 1)
+                newline = data.find('\n', pos + 1)
+                if close >= 0 and (newline < 0 or close < newline):
+                    yield make('SCONST', data[pos + 1:close], pos)
+                    pos = close + 1
+                else:
+                    print("%d: Unterminated string" % self.lineno)
+                    pos = newline if newline >= 0 else end
+            else:
+                match = CCONST.match(data, pos) if c == "'" else None
+                if match:
+                    value = char_constant_value(match.group('charval'), match.group('intval'))
+                    yield make('CCONST', value, pos)
+                    pos = match.end()
+                else:
+                    print("Illegal character '%s'" % c)
+                    pos += 1
+            self.lexpos = pos
+
+    def comment(self, data, pos):
+        """Skips the comment at `pos`, counting its lines as t_COMMENT does."""
+        if data.startswith('//', pos):
+            stop = data.find('\n', pos)
+            if stop < 0:
+                stop = len(data)
+        else:
+            stop = data.find('*/', pos + 2)
+            if stop < 0:
+                print("%d: Unterminated comment" % self.lineno)
+                return len(data)
+            stop += 2
+        self.lineno += len(data[pos:stop].splitlines()) - 1
+        return stop
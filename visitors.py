@@ -1,37 +1,166 @@
-from node import Node
-from LVM import StartOperator
+from types import MethodType
 
+from environments import cur_context
 
-class GenericVisitor:
+
+class Traversal:
+    """
+    Visits a tree from an explicit stack instead of recursively, so deep
+    trees do not hit the recursion limit.
+
+    pre(node) runs before the parts of a node and post(node) after them.
+    The parts are its children by default; a part that is a list or a
+    method is handed to emit(part) when the walk reaches it, instead of
+    being visited. Around the parts of a node whose opens_scope is set,
+    push_scope(node) runs right after pre(node) and pop_scope(node) right
+    before post(node).
+    """
+    def walk(self, root: 'Node'):
+        cls = type(self)
+        # Hooks left as the defaults below are not called at all
+        pre = self.pre if cls.pre is not Traversal.pre else None
+        post = self.post if cls.post is not Traversal.post else None
+        parts = self.parts if cls.parts is not Traversal.parts else None
+        push_scope, pop_scope, emit = self.push_scope, self.pop_scope, self.emit
+        stack = [root]
+        pop, push, extend = stack.pop, stack.append, stack.extend
+        while stack:
+            item = pop()
+            kind = type(item)
+            if kind is tuple:
+                # A hook to run once the parts before it are visited
+                item[0](item[1])
+                continue
+            if kind is list or kind is MethodType:
+                emit(item)
+                continue
+            if pre is not None:
+                pre(item)
+            if item.opens_scope:
+                if post is not None:
+                    push((post, item))
+                push((pop_scope, item))
+                push_scope(item)
+                extend(reversed(item.children if parts is None else parts(item)))
+                continue
+            children = item.children if parts is None else parts(item)
+            if children:
+                if post is not None:
+                    push((post, item))
+                extend(reversed(children))
+            elif post is not None:
+                # Nothing to visit in between, post runs right away
+                post(item)
+
+    def parts(self, node: 'Node'):
+        return node.children
+
+    def emit(self, part):
+        pass
+
+    def pre(self, node: 'Node'):
+        pass
+
+    def post(self, node: 'Node'):
+        pass
+
+    def push_scope(self, node: 'Node'):
+        pass
+
+    def pop_scope(self, node: 'Node'):
+        pass
+
+
+class ValidationVisitor(Traversal):
+    """
+    Runs the semantic checks: every node is checked after its children, and
+    the nodes that open a scope get one in the symbol environment while
+    their children are checked.
+    """
+    def pre(self, node: 'Node'):
+        node.enter_validation()
+
+    def post(self, node: 'Node'):
+        node.leave_validation()
+
+    def push_scope(self, node: 'Node'):
+        cur_context.symbol_env.push(node)
+        node.enter_scope()
+
+    def pop_scope(self, node: 'Node'):
+        node.leave_scope()
+        cur_context.symbol_env.pop()
+
+
+class InvalidationVisitor(Traversal):
+    """Drops what validation kept on the nodes, see Node.invalidate."""
+    def pre(self, node: 'Node'):
+        node.forget_validation()
+
+
+class CodeGenerator(Traversal):
+    """
+    The LVM code of a tree, in the order the nodes give it in lvm_parts().
+    Every operator is appended once to a single list, so a subtree's code is
+    not copied into each of its ancestors.
+    """
+    def __init__(self):
+        self.code = []
+
+    def parts(self, node: 'Node'):
+        return node.lvm_parts()
+
+    def emit(self, part):
+        if type(part) is list:
+            self.code.extend(part)
+        else:
+            # Operators that depend on the code generated before them
+            self.code.extend(part())
+
+
+class GenericVisitor(Traversal):
     @staticmethod
-    def f(node: Node):
+    def f(node: 'Node'):
         pass
 
     def __init__(self, inner_visitor=None):
         self.result = []
         self.inner_visitor = inner_visitor
 
-    def visit_tree(self, root: Node):
+    def visit_tree(self, root: 'Node'):
         if self.inner_visitor:
             self.inner_visitor.visit_tree(root)
-        self.__visit__(root)
+        self.walk(root)
 
-    def __visit__(self, root: Node):
-        for c in root.children:
-            self.__visit__(c)
-
-        local_result = self.f(root)
+    def post(self, node: 'Node'):
+        local_result = self.f(node)
         if local_result:
             self.result.append(local_result)
 
 
 class PrintErrorVisitor(GenericVisitor):
     @staticmethod
-    def f(node: Node):
+    def f(node: 'Node'):
         node.print_error()
 
 
-class VisualizationVisitor(GenericVisitor):
-    pass
+class DiagnosticVisitor(GenericVisitor):
+    """Collects the issues printed by PrintErrorVisitor as dicts."""
+    @staticmethod
+    def f(node: 'Node'):
+        if not node.issues:
+            return None
+        line, column = node.position
+        return [{
+            'type': issue.issue_type.name,
+            'line': line,
+            'column': column,
+            'node': node.display_name,
+            'message': issue.message(),
+        } for issue in node.issues]
+
+    @property
+    def diagnostics(self):
+        return [issue for issues in self.result for issue in issues]
 
 semantic_visitor = PrintErrorVisitor()
@@ -1,25 +1,42 @@
 import json
 
+from visitors import Traversal
+
 blue = '#42d9f4'
 red = '#ff9696'
 yellow = '#eeff00'
 
 
-def vis_data_for_tree(root):
-    nodes = []
-    edges = []
-    n_id = 0
-    e_id = 0
-
-    def rec_data_for_tree(node, parent_id, label=None):
-        if not node:
-            return
+class VisualizationVisitor(Traversal):
+    """
+    Lists the nodes and edges of a tree for vis.js, numbering the nodes in
+    the order they are first reached.
+    """
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.n_id = 0
+        # Ids of the nodes being visited, the last one is the parent of the
+        # next node, and the label of the edge that leads to it
+        self.parents = []
+        self.label = None
+
+    def parts(self, node):
+        children, labels = node.children, node.labels
+        parts = []
+        for i, child in enumerate(children):
+            if child:
+                parts.append((self.set_label, labels[i] if labels else None))
+                parts.append(child)
+        return parts
 
-        nonlocal nodes, edges, n_id, e_id
+    def set_label(self, label):
+        self.label = label
 
+    def pre(self, node):
         color = yellow if node is None else blue if node.is_valid else red
         node_dict = {
-                      "id": n_id,
+                      "id": self.n_id,
                       "label": str(node),
                       "color": color
                     }
@@ -29,25 +46,27 @@ def vis_data_for_tree(root):
 
             node_dict['title'] = err_msg
 
-        nodes.append(node_dict)
+        self.nodes.append(node_dict)
 
-        if parent_id is not None:
-            d = {"from": parent_id, "to": n_id, "id": e_id}
-            if label:
-                d['label'] = label
-            edges.append(d)
+        if self.parents:
+            # Edges are numbered as the nodes they lead to
+            d = {"from": self.parents[-1], "to": self.n_id, "id": self.n_id}
+            if self.label:
+                d['label'] = self.label
+            self.edges.append(d)
 
-        cur_id = n_id
-        n_id += 1
-        e_id += 1
+        self.parents.append(self.n_id)
+        self.n_id += 1
 
-        children, labels = node.children, node.labels
-        for i, child in enumerate(children):
-            label = labels[i] if labels else None
-            rec_data_for_tree(child, cur_id, label)
+    def post(self, node):
+        self.parents.pop()
 
-    rec_data_for_tree(root, None)
-    return json.dumps(nodes), json.dumps(edges)
+
+def vis_data_for_tree(root):
+    visitor = VisualizationVisitor()
+    if root:
+        visitor.walk(root)
+    return json.dumps(visitor.nodes), json.dumps(visitor.edges)
 
 
 def make_js(nodes, edges):